@@ -0,0 +1,139 @@
+# Background adapter checkpointing for interruptible (spot) training with qlora.py
+import dataclasses
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import torch
+from peft import get_peft_model_state_dict
+from safetensors.torch import save_file
+from transformers import TrainerCallback
+
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint-(\d+)")
+# file names the Trainer looks for in resume_from_checkpoint
+ADAPTER_WEIGHTS = "adapter_model.safetensors"
+TRAINER_STATE = "trainer_state.json"
+OPTIMIZER = "optimizer.pt"
+SCHEDULER = "scheduler.pt"
+
+
+def to_cpu(obj):
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return obj
+
+
+def list_checkpoints(checkpoint_dir):
+    """Complete checkpoints in checkpoint_dir, oldest first.
+
+    Checkpoints are written to a .tmp directory and renamed when done, so a
+    job killed mid-write never leaves a directory that matches the pattern.
+    """
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    checkpoints = []
+    for name in os.listdir(checkpoint_dir):
+        match = CHECKPOINT_PATTERN.fullmatch(name)
+        path = os.path.join(checkpoint_dir, name)
+        if match and all(os.path.isfile(os.path.join(path, f)) for f in (ADAPTER_WEIGHTS, TRAINER_STATE)):
+            checkpoints.append((int(match.group(1)), path))
+    return [path for _, path in sorted(checkpoints)]
+
+
+def latest_checkpoint(checkpoint_dir):
+    checkpoints = list_checkpoints(checkpoint_dir)
+    return checkpoints[-1] if checkpoints else None
+
+
+class AsyncCheckpointCallback(TrainerCallback):
+    """Every `save_steps` optimizer steps, copies the adapter, optimizer and scheduler
+    state to CPU and writes it to `checkpoint_dir` from a background thread.
+
+    Only the copy (and waiting for a previous write that is still running)
+    blocks training, that time is accumulated in `blocked_seconds`.
+    """
+
+    def __init__(self, checkpoint_dir, save_steps, total_limit=2):
+        self.checkpoint_dir = checkpoint_dir
+        self.save_steps = save_steps
+        self.total_limit = total_limit
+        self.blocked_seconds = 0.0
+        self.write_seconds = 0.0
+        self.num_checkpoints = 0
+        self._writer = None
+        self._error = None
+
+    def _wait_for_writer(self):
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Background checkpoint write failed") from error
+
+    def on_step_end(self, args, state, control, model=None, optimizer=None, lr_scheduler=None, **kwargs):
+        if state.global_step % self.save_steps != 0:
+            return
+
+        start = time.perf_counter()
+        self._wait_for_writer()
+        model = getattr(model, "module", model)
+        snapshot = {
+            "adapter": to_cpu(get_peft_model_state_dict(model)),
+            "peft_config": model.peft_config["default"],
+            "optimizer": to_cpu(optimizer.state_dict()),
+            "scheduler": lr_scheduler.state_dict(),
+            # same format as TrainerState.save_to_json, serialized now since the Trainer mutates state
+            "trainer_state": json.dumps(dataclasses.asdict(state), indent=2, sort_keys=True) + "\n",
+        }
+        self._writer = threading.Thread(
+            target=self._write, args=(state.global_step, snapshot), name="async-checkpoint", daemon=True
+        )
+        self._writer.start()
+        self.blocked_seconds += time.perf_counter() - start
+
+    def _write(self, step, snapshot):
+        try:
+            start = time.perf_counter()
+            final_dir = os.path.join(self.checkpoint_dir, f"checkpoint-{step}")
+            tmp_dir = f"{final_dir}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            save_file(snapshot["adapter"], os.path.join(tmp_dir, ADAPTER_WEIGHTS), metadata={"format": "pt"})
+            snapshot["peft_config"].save_pretrained(tmp_dir)
+            torch.save(snapshot["optimizer"], os.path.join(tmp_dir, OPTIMIZER))
+            torch.save(snapshot["scheduler"], os.path.join(tmp_dir, SCHEDULER))
+            with open(os.path.join(tmp_dir, TRAINER_STATE), "w") as f:
+                f.write(snapshot["trainer_state"])
+
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.rename(tmp_dir, final_dir)
+            self._rotate()
+            self.num_checkpoints += 1
+            self.write_seconds += time.perf_counter() - start
+            print(f"Checkpoint written to {final_dir}")
+        except Exception as e:
+            self._error = e
+
+    def _rotate(self):
+        for path in list_checkpoints(self.checkpoint_dir)[: -self.total_limit]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        start = time.perf_counter()
+        self._wait_for_writer()
+        self.blocked_seconds += time.perf_counter() - start
+        print(
+            f"Async checkpointing: {self.num_checkpoints} checkpoints, "
+            f"{self.blocked_seconds:.2f}s training blocked, "
+            f"{self.write_seconds:.2f}s written in the background"
+        )
@@ -0,0 +1,235 @@
+# Streaming LoRA merge: applies adapter deltas to the base model one tensor at a time
+# python merge_adapters.py --adapter_dir /tmp/tun --output_dir /opt/ml/model
+# python merge_adapters.py --adapter_dir /tmp/tiny-adapter --output_dir /tmp/tiny-merged --verify True
+from dataclasses import dataclass, field
+import json
+import math
+import os
+import re
+import shutil
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+from transformers import HfArgumentParser
+
+
+PEFT_PREFIX = "base_model.model."
+CONFIG_FILES = ["config.json", "generation_config.json"]
+DTYPES = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32}
+
+
+@dataclass
+class MergeArguments:
+    adapter_dir: str = field(
+        default=None, metadata={"help": "Directory with adapter_config.json and adapter_model.safetensors"}
+    )
+    output_dir: str = field(default=None, metadata={"help": "Where to write the merged safetensors shards"})
+    base_model: str = field(
+        default=None,
+        metadata={"help": "Local dir or hub id of the base model, defaults to base_model_name_or_path"},
+    )
+    torch_dtype: str = field(default="float16", metadata={"help": "dtype of the merged weights"})
+    max_shard_size: str = field(default="2GB", metadata={"help": "Maximum size of a merged shard"})
+    verify: bool = field(
+        default=False,
+        metadata={"help": "Compare against peft merge_and_unload (loads the full model, tiny models only)"},
+    )
+
+
+def parse_size(size):
+    units = {"KB": 10**3, "MB": 10**6, "GB": 10**9}
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]B)", size.strip().upper())
+    if match is None:
+        raise ValueError(f"Can't parse shard size {size!r}, expected e.g. '2GB' or '500MB'")
+    return int(float(match.group(1)) * units[match.group(2)])
+
+
+def resolve_base_model(base_model):
+    if os.path.isdir(base_model):
+        return base_model
+
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(base_model, allow_patterns=["*.safetensors", "*.json"])
+
+
+def base_shards(base_dir):
+    index_path = os.path.join(base_dir, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            weight_map = json.load(f)["weight_map"]
+        return sorted(set(weight_map.values()))
+    if os.path.exists(os.path.join(base_dir, "model.safetensors")):
+        return ["model.safetensors"]
+    raise FileNotFoundError(f"No safetensors weights found in {base_dir}")
+
+
+def load_lora_deltas(adapter_dir):
+    """Reads the (small) adapter into memory as {base weight name: (A, B, scaling)}."""
+    with open(os.path.join(adapter_dir, "adapter_config.json")) as f:
+        config = json.load(f)
+
+    lora = {}
+    with safe_open(os.path.join(adapter_dir, "adapter_model.safetensors"), framework="pt") as f:
+        for key in f.keys():
+            match = re.fullmatch(r"(.+)\.lora_([AB])(?:\.\w+)?\.weight", key)
+            if match is None:
+                raise ValueError(f"Unsupported adapter tensor {key}, only LoRA A/B weights can be merged")
+            module = match.group(1)[len(PEFT_PREFIX):] if match.group(1).startswith(PEFT_PREFIX) else match.group(1)
+            lora.setdefault(module, {})[match.group(2)] = f.get_tensor(key)
+
+    deltas = {}
+    for module, weights in lora.items():
+        rank = weights["A"].shape[0]
+        alpha = config["lora_alpha"]
+        for pattern, pattern_alpha in (config.get("alpha_pattern") or {}).items():
+            if re.fullmatch(rf".*\.{pattern}$", module) or module == pattern:
+                alpha = pattern_alpha
+        scaling = alpha / math.sqrt(rank) if config.get("use_rslora") else alpha / rank
+        deltas[f"{module}.weight"] = (weights["A"], weights["B"], scaling)
+    return config, deltas
+
+
+def apply_delta(weight, lora_a, lora_b, scaling, fan_in_fan_out, dtype):
+    merged = weight.to(torch.float32)
+    delta = (lora_b.to(torch.float32) @ lora_a.to(torch.float32)) * scaling
+    merged += delta.T if fan_in_fan_out else delta
+    return merged.to(dtype)
+
+
+class ShardWriter:
+    """Buffers tensors up to max_shard_size bytes and flushes them as a safetensors shard."""
+
+    def __init__(self, output_dir, max_shard_size):
+        self.output_dir = output_dir
+        self.max_shard_size = max_shard_size
+        self.buffer = {}
+        self.buffer_size = 0
+        self.shards = []  # [(tmp file name, [tensor names])]
+        self.total_size = 0
+
+    def add(self, name, tensor):
+        size = tensor.numel() * tensor.element_size()
+        if self.buffer and self.buffer_size + size > self.max_shard_size:
+            self.flush()
+        self.buffer[name] = tensor.contiguous()
+        self.buffer_size += size
+        self.total_size += size
+
+    def flush(self):
+        if not self.buffer:
+            return
+        tmp_name = f"tmp-{len(self.shards):05d}.safetensors"
+        save_file(self.buffer, os.path.join(self.output_dir, tmp_name), metadata={"format": "pt"})
+        self.shards.append((tmp_name, list(self.buffer)))
+        self.buffer = {}
+        self.buffer_size = 0
+
+    def remove_stale_weights(self):
+        """Removes weights of an earlier merge into output_dir, from_pretrained would load them instead."""
+        written = {tmp_name for tmp_name, _ in self.shards}
+        for name in sorted(os.listdir(self.output_dir)):
+            stale_shard = name.endswith(".safetensors") and name.startswith(("model", "tmp-")) and name not in written
+            if stale_shard or name == "model.safetensors.index.json":
+                print(f"Removing {name} left over in {self.output_dir}")
+                os.remove(os.path.join(self.output_dir, name))
+
+    def close(self):
+        self.flush()
+        self.remove_stale_weights()
+        weight_map = {}
+        for i, (tmp_name, names) in enumerate(self.shards):
+            if len(self.shards) == 1:
+                shard_name = "model.safetensors"
+            else:
+                shard_name = f"model-{i + 1:05d}-of-{len(self.shards):05d}.safetensors"
+            os.replace(os.path.join(self.output_dir, tmp_name), os.path.join(self.output_dir, shard_name))
+            weight_map.update({name: shard_name for name in names})
+
+        if len(self.shards) > 1:
+            index = {"metadata": {"total_size": self.total_size}, "weight_map": weight_map}
+            with open(os.path.join(self.output_dir, "model.safetensors.index.json"), "w") as f:
+                json.dump(index, f, indent=2)
+        return weight_map
+
+
+def merge_adapter_shards(adapter_dir, output_dir, base_model=None, torch_dtype="float16", max_shard_size="2GB"):
+    """Merges a saved LoRA adapter into its base model without loading the full model.
+
+    Base shards are read one tensor at a time, so peak memory is roughly one
+    output shard plus the adapter weights.
+    """
+    config, deltas = load_lora_deltas(adapter_dir)
+    base_dir = resolve_base_model(base_model or config["base_model_name_or_path"])
+    dtype = DTYPES[torch_dtype]
+    os.makedirs(output_dir, exist_ok=True)
+
+    writer = ShardWriter(output_dir, parse_size(max_shard_size))
+    pending = set(deltas)
+    for shard in base_shards(base_dir):
+        print(f"Merging {shard}")
+        with safe_open(os.path.join(base_dir, shard), framework="pt") as f:
+            for name in f.keys():
+                tensor = f.get_tensor(name)
+                if name in deltas:
+                    lora_a, lora_b, scaling = deltas[name]
+                    tensor = apply_delta(
+                        tensor, lora_a, lora_b, scaling, config.get("fan_in_fan_out", False), dtype
+                    )
+                    pending.discard(name)
+                elif tensor.is_floating_point():
+                    tensor = tensor.to(dtype)
+                writer.add(name, tensor)
+    if pending:
+        raise ValueError(f"Adapter targets weights missing from the base model: {sorted(pending)[:5]}")
+    writer.close()
+
+    for config_file in CONFIG_FILES:
+        if os.path.exists(os.path.join(base_dir, config_file)):
+            shutil.copy(os.path.join(base_dir, config_file), os.path.join(output_dir, config_file))
+    with open(os.path.join(output_dir, "config.json")) as f:
+        model_config = json.load(f)
+    model_config["torch_dtype"] = torch_dtype
+    with open(os.path.join(output_dir, "config.json"), "w") as f:
+        json.dump(model_config, f, indent=2)
+
+    print(f"Merged {len(deltas)} LoRA weights into {len(writer.shards)} shard(s) in {output_dir}")
+
+
+def verify_merge(adapter_dir, output_dir, torch_dtype="float16", atol=1e-2):
+    """Checks the streamed merge against peft's in-memory merge_and_unload."""
+    from peft import AutoPeftModelForCausalLM
+
+    model = AutoPeftModelForCausalLM.from_pretrained(adapter_dir, torch_dtype=torch.float32)
+    expected = model.merge_and_unload().state_dict()
+
+    weight_files = [name for name in os.listdir(output_dir) if name.endswith(".safetensors")]
+    checked = 0
+    for weight_file in weight_files:
+        with safe_open(os.path.join(output_dir, weight_file), framework="pt") as f:
+            for name in f.keys():
+                if name not in expected:
+                    continue
+                merged = f.get_tensor(name).to(torch.float32)
+                reference = expected[name].to(DTYPES[torch_dtype]).to(torch.float32)
+                if not torch.allclose(merged, reference, atol=atol):
+                    max_diff = (merged - reference).abs().max().item()
+                    raise AssertionError(f"{name} differs from merge_and_unload by {max_diff}")
+                checked += 1
+    print(f"Verified {checked} tensors against merge_and_unload")
+
+
+if __name__ == "__main__":
+    parser = HfArgumentParser(MergeArguments)
+    (merge_args,) = parser.parse_args_into_dataclasses()
+
+    merge_adapter_shards(
+        merge_args.adapter_dir,
+        merge_args.output_dir,
+        base_model=merge_args.base_model,
+        torch_dtype=merge_args.torch_dtype,
+        max_shard_size=merge_args.max_shard_size,
+    )
+    if merge_args.verify:
+        verify_merge(merge_args.adapter_dir, merge_args.output_dir, torch_dtype=merge_args.torch_dtype)
@@ -1,6 +1,7 @@
 # Training script By Philip Schmid
 from dataclasses import dataclass, field
 import os
+import time
 
 import torch
 from datasets import load_dataset
@@ -8,6 +9,7 @@ from tqdm import tqdm
 from transformers import (
     AutoTokenizer,
     HfArgumentParser,
+    IntervalStrategy,
     TrainingArguments,
     BitsAndBytesConfig,
     AutoModelForCausalLM,
@@ -16,6 +18,18 @@ from peft import LoraConfig
 
 from trl import SFTTrainer
 
+from async_checkpoint import AsyncCheckpointCallback, latest_checkpoint
+from merge_adapters import merge_adapter_shards
+from streaming_data import PackedJsonlDataset
+from train_benchmark import (
+    BenchmarkSFTTrainer,
+    ProfilerCallback,
+    StepTimer,
+    build_tiny_model,
+    parse_step_window,
+    write_report,
+)
+
 
 tqdm.pandas()
 
@@ -39,28 +53,84 @@ class ScriptArguments:
         metadata={"help": "Wether to merge weights for LoRA."},
         default=False,
     )
+    streaming: bool = field(
+        default=False,
+        metadata={
+            "help": "Stream dataset_path as JSONL with on-the-fly tokenization and packing "
+            "instead of building an Arrow dataset (requires max_steps)"
+        },
+    )
+    shuffle_buffer_size: int = field(
+        default=1000, metadata={"help": "Rows held in the shuffle buffer when streaming"}
+    )
+    checkpoint_dir: str = field(
+        default="/opt/ml/checkpoints",
+        metadata={"help": "Synced to S3 by SageMaker (checkpoint_s3_uri), training resumes from here"},
+    )
+    checkpoint_steps: int = field(
+        default=0,
+        metadata={"help": "Write an adapter checkpoint in the background every N steps, 0 disables"},
+    )
+    checkpoint_total_limit: int = field(
+        default=2, metadata={"help": "Number of checkpoints kept in checkpoint_dir"}
+    )
+    streaming_merge: bool = field(
+        default=True,
+        metadata={
+            "help": "Merge adapters tensor by tensor from the base safetensors shards "
+            "instead of loading the full fp16 model"
+        },
+    )
+    benchmark: bool = field(
+        default=False,
+        metadata={
+            "help": "Train a tiny randomly initialized copy of model_id on CPU (no quantization, "
+            "no flash attention) and report throughput instead of saving a model"
+        },
+    )
+    benchmark_attn_implementation: str = field(
+        default="sdpa", metadata={"help": "Attention for the benchmark model: sdpa or eager"}
+    )
+    profile_steps: str = field(
+        default=None,
+        metadata={"help": "Step window 'start,end' to export as a torch.profiler trace in benchmark mode"},
+    )
 
 
 if __name__ == "__main__":
+    script_start = time.perf_counter()
     parser = HfArgumentParser((ScriptArguments, TrainingArguments))
     script_args, training_args = parser.parse_args_into_dataclasses()
     training_args.gradient_checkpointing_kwargs = dict(use_reentrant=False)
+    if script_args.checkpoint_steps > 0 and training_args.save_strategy != IntervalStrategy.NO:
+        # the Trainer's own checkpoints are synchronous and would stall training next to the async ones
+        print(f"--checkpoint_steps is set, disabling save_strategy={training_args.save_strategy.value}")
+        training_args.save_strategy = IntervalStrategy.NO
 
     ################
     # Dataset
     ################
-    dataset = load_dataset(
-        "json",
-        data_files=script_args.dataset_path,
-        split="train",
-    )
+    if script_args.streaming:
+        if training_args.max_steps <= 0:
+            raise ValueError("--streaming needs --max_steps, the stream has no known length")
+    else:
+        dataset = load_dataset(
+            "json",
+            data_files=script_args.dataset_path,
+            split="train",
+        )
 
     ################
     # Model & Tokenizer
     ################
     torch_dtype = torch.bfloat16 if training_args.bf16 else torch.float32
 
-    if script_args.use_qlora:
+    if script_args.benchmark:
+        print("Benchmark mode: tiny random model, no quantization")
+        model = build_tiny_model(
+            script_args.model_id, attn_implementation=script_args.benchmark_attn_implementation
+        )
+    elif script_args.use_qlora:
         print("Using QLoRA")
         quantization_config = BitsAndBytesConfig(
             load_in_4bit=True,
@@ -71,17 +141,28 @@ if __name__ == "__main__":
     else:
         quantization_config = None
 
-    model = AutoModelForCausalLM.from_pretrained(
-        script_args.model_id,
-        device_map="auto",
-        attn_implementation="flash_attention_2",
-        torch_dtype=torch_dtype,
-        quantization_config=quantization_config,
-    )
+    if not script_args.benchmark:
+        model = AutoModelForCausalLM.from_pretrained(
+            script_args.model_id,
+            device_map="auto",
+            attn_implementation="flash_attention_2",
+            torch_dtype=torch_dtype,
+            quantization_config=quantization_config,
+        )
     tokenizer = AutoTokenizer.from_pretrained(script_args.model_id, use_fast=True)
     tokenizer.pad_token = tokenizer.eos_token
     tokenizer.padding_side = 'right'
 
+    if script_args.streaming:
+        # tokenized and packed lazily, SFTTrainer passes torch datasets through untouched
+        dataset = PackedJsonlDataset(
+            script_args.dataset_path,
+            tokenizer,
+            max_seq_length=script_args.max_seq_length,
+            shuffle_buffer_size=script_args.shuffle_buffer_size,
+            seed=training_args.seed,
+        )
+
     ################
     # PEFT
     ################
@@ -99,7 +180,12 @@ if __name__ == "__main__":
     ################
     # Training
     ################
-    trainer = SFTTrainer(
+    trainer_cls, trainer_kwargs = SFTTrainer, {}
+    if script_args.benchmark:
+        step_timer = StepTimer(start_time=script_start)
+        trainer_cls, trainer_kwargs = BenchmarkSFTTrainer, {"step_timer": step_timer}
+
+    trainer = trainer_cls(
         model=model,
         args=training_args,
         train_dataset=dataset,
@@ -111,8 +197,46 @@ if __name__ == "__main__":
             "add_special_tokens": False,  # We template with special tokens
             "append_concat_token": False,  # No need to add additional separator token
         },
+        **trainer_kwargs,
     )
-    trainer.train()
+    if script_args.benchmark and script_args.profile_steps:
+        start_step, end_step = parse_step_window(script_args.profile_steps)
+        trace_path = os.path.join(training_args.output_dir, f"trace_steps_{start_step}_{end_step}.json")
+        trainer.add_callback(ProfilerCallback(start_step, end_step, trace_path))
+    resume_from_checkpoint = None
+    if script_args.checkpoint_steps > 0:
+        checkpoint_callback = AsyncCheckpointCallback(
+            script_args.checkpoint_dir,
+            save_steps=script_args.checkpoint_steps,
+            total_limit=script_args.checkpoint_total_limit,
+        )
+        trainer.add_callback(checkpoint_callback)
+        resume_from_checkpoint = latest_checkpoint(script_args.checkpoint_dir)
+        if resume_from_checkpoint:
+            print(f"Resuming from {resume_from_checkpoint}")
+    trainer.train(resume_from_checkpoint=resume_from_checkpoint)
+
+    if script_args.benchmark:
+        os.makedirs(training_args.output_dir, exist_ok=True)
+        write_report(
+            step_timer,
+            trainer.model,
+            os.path.join(training_args.output_dir, "benchmark.json"),
+            extra={
+                "attn_implementation": script_args.benchmark_attn_implementation,
+                "streaming": script_args.streaming,
+                "dataloader_num_workers": training_args.dataloader_num_workers,
+                "checkpoint_blocked_s": checkpoint_callback.blocked_seconds
+                if script_args.checkpoint_steps > 0
+                else None,
+                "lora_r": peft_config.r,
+                "lora_target_modules": sorted(peft_config.target_modules),
+                "max_seq_length": script_args.max_seq_length,
+                "per_device_train_batch_size": training_args.per_device_train_batch_size,
+                "gradient_accumulation_steps": training_args.gradient_accumulation_steps,
+            },
+        )
+        raise SystemExit(0)
 
     ##########################
     # SAVE MODEL FOR SAGEMAKER
@@ -131,21 +255,30 @@ if __name__ == "__main__":
         del trainer
         torch.cuda.empty_cache()
 
-        from peft import AutoPeftModelForCausalLM
-
         # list file in output_dir
         print(os.listdir(training_args.output_dir))
 
-        # load PEFT model in fp16
-        model = AutoPeftModelForCausalLM.from_pretrained(
-            training_args.output_dir,
-            low_cpu_mem_usage=True,
-            torch_dtype=torch.float16,
-        )
-        # Merge LoRA and base model and save
-        model = model.merge_and_unload()
-        model.save_pretrained(
-            sagemaker_save_dir, safe_serialization=True, max_shard_size="2GB"
-        )
+        if script_args.streaming_merge:
+            # merge shard by shard, peak memory is about one 2GB output shard
+            merge_adapter_shards(
+                training_args.output_dir,
+                sagemaker_save_dir,
+                torch_dtype="float16",
+                max_shard_size="2GB",
+            )
+        else:
+            from peft import AutoPeftModelForCausalLM
+
+            # load PEFT model in fp16
+            model = AutoPeftModelForCausalLM.from_pretrained(
+                training_args.output_dir,
+                low_cpu_mem_usage=True,
+                torch_dtype=torch.float16,
+            )
+            # Merge LoRA and base model and save
+            model = model.merge_and_unload()
+            model.save_pretrained(
+                sagemaker_save_dir, safe_serialization=True, max_shard_size="2GB"
+            )
     else:
         trainer.model.save_pretrained(sagemaker_save_dir, safe_serialization=True)
\ No newline at end of file
@@ -0,0 +1,63 @@
+# Compares time-to-first-step and steady-state throughput of the Arrow and streaming dataset paths
+# python streaming_benchmark.py --model_id google/gemma-2b-it --dataset_path tmp/test.jsonl --max_steps 20
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def run_qlora_benchmark(args, output_dir, streaming):
+    cmd = [
+        sys.executable, "qlora.py",
+        "--benchmark", "True",
+        "--model_id", args.model_id,
+        "--dataset_path", os.path.abspath(args.dataset_path),
+        "--max_seq_length", str(args.max_seq_length),
+        "--max_steps", str(args.max_steps),
+        "--per_device_train_batch_size", str(args.batch_size),
+        # same worker count for both paths, otherwise the comparison measures the workers too
+        "--dataloader_num_workers", str(args.num_workers),
+        "--streaming", str(streaming),
+        "--output_dir", os.path.abspath(output_dir),
+        "--use_cpu", "True",
+        "--report_to", "none",
+        "--save_strategy", "no",
+        "--logging_steps", str(args.max_steps),
+    ]
+    subprocess.run(cmd, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(output_dir, "benchmark.json")) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_id", required=True)
+    parser.add_argument("--dataset_path", required=True)
+    parser.add_argument("--max_seq_length", type=int, default=512)
+    parser.add_argument("--max_steps", type=int, default=20)
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--num_workers", type=int, default=2, help="Dataloader workers for both paths")
+    parser.add_argument("--output_dir", default="/tmp/streaming_benchmark")
+    args = parser.parse_args()
+
+    # the HF datasets cache would hide the Arrow conversion cost on the second run
+    os.environ["HF_DATASETS_CACHE"] = tempfile.mkdtemp(prefix="hf_datasets_cache_")
+
+    results = {
+        "num_workers": args.num_workers,
+        "materialized": run_qlora_benchmark(args, os.path.join(args.output_dir, "materialized"), False),
+        "streaming": run_qlora_benchmark(args, os.path.join(args.output_dir, "streaming"), True),
+    }
+    with open(os.path.join(args.output_dir, "comparison.json"), "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"dataloader workers: {args.num_workers}")
+    print(f"{'path':<14}{'first step (s)':>16}{'tokens/sec':>14}{'dataloader (s/step)':>22}")
+    for name in ("materialized", "streaming"):
+        report = results[name]
+        print(
+            f"{name:<14}{report['time_to_first_step_s']:>16.2f}{report['tokens_per_sec']:>14.1f}"
+            f"{report['step_time_breakdown_s']['dataloader']:>22.4f}"
+        )
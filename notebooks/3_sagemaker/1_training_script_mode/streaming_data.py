@@ -0,0 +1,84 @@
+# Streaming JSONL dataset for qlora.py (--streaming True)
+import json
+import os
+import random
+
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+class PackedJsonlDataset(IterableDataset):
+    """Reads a chat JSONL file lazily, tokenizes on the fly and packs into fixed-length blocks.
+
+    Every dataloader worker owns a contiguous byte range of the file, so
+    nothing is materialized up front and training starts after the first
+    `max_seq_length` tokens have been read. Rows are shuffled through a
+    bounded buffer instead of a global permutation.
+    """
+
+    def __init__(self, path, tokenizer, max_seq_length, shuffle_buffer_size=1000, seed=42):
+        self.path = path
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        # called by the Trainer at the start of every epoch
+        self.epoch = epoch
+
+    def _byte_range(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        size = os.path.getsize(self.path)
+        return size * worker_id // num_workers, size * (worker_id + 1) // num_workers, worker_id
+
+    def _read_rows(self):
+        start, end, _ = self._byte_range()
+        with open(self.path, "rb") as f:
+            if start > 0:
+                # the line crossing `start` belongs to the previous worker
+                f.seek(start - 1)
+                f.readline()
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield json.loads(line)
+
+    def _shuffled(self, rows, rng):
+        if self.shuffle_buffer_size <= 1:
+            yield from rows
+            return
+        buffer = []
+        for row in rows:
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(row)
+                continue
+            i = rng.randrange(len(buffer))
+            yield buffer[i]
+            buffer[i] = row
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def _tokenize(self, row):
+        if "messages" in row:
+            text = self.tokenizer.apply_chat_template(row["messages"], tokenize=False)
+        else:
+            text = row["text"]
+        # templates already contain the special tokens
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def __iter__(self):
+        _, _, worker_id = self._byte_range()
+        rng = random.Random(f"{self.seed}-{self.epoch}-{worker_id}")
+
+        tokens = []
+        for row in self._shuffled(self._read_rows(), rng):
+            tokens.extend(self._tokenize(row))
+            while len(tokens) >= self.max_seq_length:
+                block = torch.tensor(tokens[: self.max_seq_length], dtype=torch.long)
+                tokens = tokens[self.max_seq_length:]
+                yield {"input_ids": block, "labels": block.clone()}
@@ -0,0 +1,198 @@
+# Helpers for running qlora.py as a CPU throughput benchmark (--benchmark True)
+# python qlora.py --benchmark True --model_id google/gemma-2b-it --dataset_path tmp/test.jsonl \
+#     --output_dir /tmp/bench --use_cpu True --max_steps 20 --per_device_train_batch_size 1 \
+#     --report_to none --profile_steps 5,8
+import json
+import resource
+import time
+
+import torch
+from transformers import AutoConfig, AutoModelForCausalLM, TrainerCallback
+from trl import SFTTrainer
+
+
+def build_tiny_model(model_id, attn_implementation="sdpa", num_layers=2, hidden_size=128):
+    """Randomly initialized, shrunk copy of `model_id` architecture.
+
+    Keeps the module names (q_proj, gate_proj, ...) so the LoRA target_modules
+    of the real run apply unchanged, but is small enough to train on CPU.
+    """
+    config = AutoConfig.from_pretrained(model_id)
+    num_heads = 4
+    config.num_hidden_layers = num_layers
+    config.hidden_size = hidden_size
+    config.intermediate_size = hidden_size * 2
+    config.num_attention_heads = num_heads
+    if hasattr(config, "num_key_value_heads"):
+        config.num_key_value_heads = min(config.num_key_value_heads, num_heads)
+    if hasattr(config, "head_dim"):
+        config.head_dim = hidden_size // num_heads
+
+    return AutoModelForCausalLM.from_config(
+        config,
+        attn_implementation=attn_implementation,
+        torch_dtype=torch.float32,
+    )
+
+
+def count_parameters(model):
+    trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    total = sum(p.numel() for p in model.parameters())
+    return trainable, total
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StepTimer(TrainerCallback):
+    """Splits every optimizer step into dataloader / forward / backward / optimizer time.
+
+    The Trainer only exposes step boundaries through callbacks, so forward and
+    backward are marked by BenchmarkSFTTrainer and everything between the end
+    of the last backward and on_step_end is attributed to the optimizer
+    (grad clipping, optimizer.step, lr scheduler, zero_grad).
+    """
+
+    def __init__(self, start_time=None):
+        # perf_counter() at script start, used to report time to the first step
+        self.start_time = start_time
+        self.time_to_first_step = None
+        self.steps = []
+        self._current = None
+        self._mark = None
+        self._forward_start = None
+
+    def _new_step(self):
+        return {"dataloader": 0.0, "forward": 0.0, "backward": 0.0, "optimizer": 0.0, "tokens": 0}
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._mark = time.perf_counter()
+
+    def start_micro_batch(self, inputs):
+        now = time.perf_counter()
+        if self._current is None:
+            self._current = self._new_step()
+        self._current["dataloader"] += now - self._mark
+        self._current["tokens"] += int(inputs["input_ids"].numel())
+        self._forward_start = now
+
+    def end_forward(self):
+        if self._forward_start is None:
+            # compute_loss called outside of a training step (e.g. evaluation)
+            return
+        now = time.perf_counter()
+        self._current["forward"] += now - self._forward_start
+        self._mark = now
+
+    def end_backward(self):
+        now = time.perf_counter()
+        self._current["backward"] += now - self._mark
+        self._forward_start = None
+        self._mark = now
+
+    def on_substep_end(self, args, state, control, **kwargs):
+        self._mark = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        self._current["optimizer"] += now - self._mark
+        self.steps.append(self._current)
+        self._current = None
+        self._mark = now
+        if self.time_to_first_step is None and self.start_time is not None:
+            self.time_to_first_step = now - self.start_time
+
+    def summary(self, warmup_steps=1):
+        steps = self.steps[warmup_steps:] or self.steps
+        if not steps:
+            return {}
+        totals = {key: sum(step[key] for step in steps) for key in steps[0]}
+        step_time = sum(totals[key] for key in ("dataloader", "forward", "backward", "optimizer"))
+        return {
+            "time_to_first_step_s": self.time_to_first_step,
+            "measured_steps": len(steps),
+            "warmup_steps": len(self.steps) - len(steps),
+            "tokens_per_sec": totals["tokens"] / step_time if step_time else 0.0,
+            "mean_step_time_s": step_time / len(steps),
+            "step_time_breakdown_s": {
+                key: totals[key] / len(steps)
+                for key in ("dataloader", "forward", "backward", "optimizer")
+            },
+        }
+
+
+class ProfilerCallback(TrainerCallback):
+    """Records a torch.profiler chrome trace for optimizer steps [start_step, end_step)."""
+
+    def __init__(self, start_step, end_step, trace_path):
+        self.trace_path = trace_path
+        self.profiler = torch.profiler.profile(
+            activities=[torch.profiler.ProfilerActivity.CPU],
+            schedule=torch.profiler.schedule(
+                wait=max(start_step - 1, 0),
+                warmup=1 if start_step > 0 else 0,
+                active=end_step - start_step,
+                repeat=1,
+            ),
+            on_trace_ready=self._export,
+            record_shapes=True,
+            profile_memory=True,
+        )
+
+    def _export(self, profiler):
+        profiler.export_chrome_trace(self.trace_path)
+        print(f"Profiler trace written to {self.trace_path}")
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.profiler.start()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.profiler.step()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.profiler.stop()
+
+
+def parse_step_window(profile_steps):
+    start, end = (int(step) for step in profile_steps.split(","))
+    if not 0 <= start < end:
+        raise ValueError(f"profile_steps must be 'start,end' with 0 <= start < end, got {profile_steps!r}")
+    return start, end
+
+
+class BenchmarkSFTTrainer(SFTTrainer):
+    """SFTTrainer that reports forward/backward boundaries to a StepTimer."""
+
+    def __init__(self, *args, step_timer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.step_timer = step_timer
+        self.add_callback(step_timer)
+
+    def training_step(self, model, inputs):
+        self.step_timer.start_micro_batch(inputs)
+        loss = super().training_step(model, inputs)
+        self.step_timer.end_backward()
+        return loss
+
+    def compute_loss(self, model, inputs, return_outputs=False):
+        outputs = super().compute_loss(model, inputs, return_outputs=return_outputs)
+        self.step_timer.end_forward()
+        return outputs
+
+
+def write_report(step_timer, model, output_path, extra=None):
+    trainable, total = count_parameters(model)
+    report = {
+        **step_timer.summary(),
+        "trainable_parameters": trainable,
+        "total_parameters": total,
+        "trainable_percent": 100 * trainable / total if total else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        **(extra or {}),
+    }
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return report
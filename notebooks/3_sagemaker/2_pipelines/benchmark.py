@@ -0,0 +1,160 @@
+# Scale-up benchmark for code/preprocessing.py, code/evaluation.py and code/batch_inference.py on synthetic abalone data
+# python benchmark.py --rows 10000 1000000 10000000
+import argparse
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SEXES = np.array(["M", "F", "I"])
+
+
+def generate_abalone(path, rows, chunk_rows=1_000_000, missing_rate=0.001, seed=0):
+    """Writes a headerless CSV with the abalone schema, in chunks to bound memory."""
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as f:
+        for start in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - start)
+            length = rng.normal(0.52, 0.12, n).clip(0.07, 0.82)
+            diameter = (length * 0.8 + rng.normal(0, 0.02, n)).clip(0.05, 0.65)
+            height = (length * 0.27 + rng.normal(0, 0.02, n)).clip(0.0, 1.13)
+            whole_weight = (length**3 * 5.6 + rng.normal(0, 0.05, n)).clip(0.002, 2.8)
+            df = pd.DataFrame({
+                "sex": SEXES[rng.integers(0, 3, n)],
+                "length": length,
+                "diameter": diameter,
+                "height": height,
+                "whole_weight": whole_weight,
+                "shucked_weight": whole_weight * 0.43,
+                "viscera_weight": whole_weight * 0.22,
+                "shell_weight": whole_weight * 0.29,
+                "rings": (length * 18 + rng.normal(0, 2, n)).clip(1, 29).round(),
+            })
+            # a few missing values so the imputers have work to do
+            numeric = df.columns[1:-1]
+            df[numeric] = df[numeric].mask(rng.random((n, len(numeric))) < missing_rate)
+            df.to_csv(f, header=False, index=False, float_format="%.4f")
+
+
+def run_stage(cmd, cwd):
+    """Runs a stage in its own process, returns wall time and that process' peak RSS."""
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=cwd)
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    # ru_maxrss is reported in kilobytes on linux
+    return {"wall_time_s": round(wall_time, 3), "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1)}
+
+
+def dir_size_mb(path):
+    return round(sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file()) / 1e6, 3)
+
+
+def train_model(base_dir):
+    # stands in for the pipeline's training step, same hyperparameters with fewer rows
+    train = pd.read_csv(f"{base_dir}/train/train.csv", header=None, nrows=100_000)
+    dtrain = xgboost.DMatrix(train.iloc[:, 1:].values, label=train.iloc[:, 0].values)
+    params = {
+        "objective": "reg:squarederror",
+        "max_depth": 5,
+        "eta": 0.2,
+        "gamma": 4,
+        "min_child_weight": 6,
+        "subsample": 0.7,
+    }
+    booster = xgboost.train(params, dtrain, num_boost_round=10)
+    os.makedirs(f"{base_dir}/model", exist_ok=True)
+    model_file = os.path.join(base_dir, "xgboost-model")
+    with open(model_file, "wb") as f:
+        pickle.dump(booster, f)
+    with tarfile.open(f"{base_dir}/model/model.tar.gz", "w:gz") as tar:
+        tar.add(model_file, arcname="xgboost-model")
+
+
+def benchmark_size(rows, code_dir, work_dir):
+    base_dir = os.path.join(work_dir, f"rows_{rows}")
+    for name in ("input", "train", "validation", "test"):
+        os.makedirs(f"{base_dir}/{name}", exist_ok=True)
+
+    start = time.perf_counter()
+    generate_abalone(f"{base_dir}/input/abalone-dataset.csv", rows)
+    result = {
+        "rows": rows,
+        "generate_s": round(time.perf_counter() - start, 3),
+        "input_mb": dir_size_mb(f"{base_dir}/input"),
+    }
+
+    result["preprocessing"] = run_stage(
+        [sys.executable, os.path.join(code_dir, "preprocessing.py"), "--base_dir", base_dir], cwd=base_dir
+    )
+    result["preprocessing"]["output_mb"] = sum(
+        dir_size_mb(f"{base_dir}/{name}") for name in ("train", "validation", "test")
+    )
+
+    train_model(base_dir)
+    result["evaluation"] = run_stage(
+        [sys.executable, os.path.join(code_dir, "evaluation.py"), "--base_dir", base_dir], cwd=base_dir
+    )
+    result["evaluation"]["output_mb"] = dir_size_mb(f"{base_dir}/evaluation")
+
+    # scores the raw input again, with the transformer saved by preprocessing.py
+    result["batch_inference"] = run_stage(
+        [sys.executable, os.path.join(code_dir, "batch_inference.py"), "--base_dir", base_dir], cwd=base_dir
+    )
+    with open(f"{base_dir}/predictions/throughput.json") as f:
+        result["batch_inference"]["rows_per_second"] = json.load(f)["rows_per_second"]
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--code_dir", default=os.path.join(HERE, "code"))
+    parser.add_argument("--work_dir", default=None, help="Keeps the generated data, temp dir by default")
+    parser.add_argument("--results_dir", default=os.path.join(HERE, "benchmark_results"))
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        for rows in args.rows:
+            print(f"Benchmarking {rows} rows")
+            report["results"].append(benchmark_size(rows, os.path.abspath(args.code_dir), work_dir))
+            print(json.dumps(report["results"][-1], indent=2))
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    results_path = os.path.join(
+        args.results_dir, f"{report['commit'] or 'nocommit'}-{report['timestamp'].replace(':', '')}.json"
+    )
+    with open(results_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {results_path}")
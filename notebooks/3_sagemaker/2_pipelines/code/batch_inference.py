@@ -0,0 +1,187 @@
+import argparse
+import glob
+import io
+import json
+import os
+import pathlib
+import pickle
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost
+
+
+# Same schema as preprocessing.py, the raw CSV may or may not still have the rings column.
+feature_columns_names = [
+    "sex",
+    "length",
+    "diameter",
+    "height",
+    "whole_weight",
+    "shucked_weight",
+    "viscera_weight",
+    "shell_weight",
+]
+numeric_features = feature_columns_names[1:]
+label_column = "rings"
+
+
+def compile_transformer(preprocess):
+    """Fitted statistics of the ColumnTransformer from preprocessing.py as plain arrays."""
+    numeric = preprocess.named_transformers_["num"]
+    categorical = preprocess.named_transformers_["cat"]
+    return {
+        "medians": numeric.named_steps["imputer"].statistics_,
+        "mean": numeric.named_steps["scaler"].mean_,
+        "scale": numeric.named_steps["scaler"].scale_,
+        "fill_value": categorical.named_steps["imputer"].fill_value,
+        "categories": categorical.named_steps["onehot"].categories_[0],
+    }
+
+
+def transform(params, numeric, sex):
+    """preprocess.transform() for a whole chunk with NumPy, unknown sexes one-hot to all zeros."""
+    numeric = np.where(np.isnan(numeric), params["medians"], numeric)
+    numeric = (numeric - params["mean"]) / params["scale"]
+    sex = np.where(pd.isna(sex), params["fill_value"], sex)
+    onehot = (sex[:, None] == params["categories"][None, :]).astype(np.float64)
+    return np.hstack([numeric, onehot])
+
+
+def read_chunk(data, has_label):
+    names = feature_columns_names + ([label_column] if has_label else [])
+    dtype = {name: np.float64 for name in names}
+    dtype["sex"] = str
+    chunk = pd.read_csv(io.BytesIO(data), header=None, names=names, dtype=dtype)
+    return chunk[numeric_features].to_numpy(), chunk["sex"].to_numpy()
+
+
+def read_blocks(path, start, end, block_bytes):
+    """Blocks of whole lines from the lines starting in [start, end) of the file."""
+    with open(path, "rb") as f:
+        if start > 0:
+            # the line crossing `start` belongs to the previous shard
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            position = f.tell()
+            data = f.read(block_bytes) + f.readline()
+            if not data:
+                break
+            if position + len(data) > end:
+                cut = data.find(b"\n", end - position - 1)
+                data = data[: cut + 1] if cut >= 0 else data
+            yield data
+
+
+_worker = {}
+
+
+def init_worker(model_file, params):
+    model = pickle.load(open(model_file, "rb"))
+    # one thread per process, the pool provides the parallelism
+    model.set_param({"nthread": 1})
+    _worker["model"] = model
+    _worker["params"] = params
+
+
+def score_shard(path, start, end, has_label, output_path, block_bytes):
+    started = time.perf_counter()
+    rows = 0
+    with open(output_path, "w") as out:
+        for data in read_blocks(path, start, end, block_bytes):
+            numeric, sex = read_chunk(data, has_label)
+            if not len(sex):
+                continue
+            predictions = _worker["model"].predict(xgboost.DMatrix(transform(_worker["params"], numeric, sex)))
+            out.write("\n".join(predictions.astype(str)))
+            out.write("\n")
+            rows += len(predictions)
+    return {"rows": rows, "seconds": time.perf_counter() - started}
+
+
+def plan_shards(input_dir, output_dir, shard_bytes):
+    """Splits every input CSV into byte ranges, one output part per range so the row order is kept."""
+    shards = []
+    for path in sorted(glob.glob(f"{input_dir}/*.csv")):
+        with open(path) as f:
+            columns = f.readline().count(",") + 1
+        if columns not in (len(feature_columns_names), len(feature_columns_names) + 1):
+            raise ValueError(f"{path} has {columns} columns, expected the abalone features with or without rings")
+        size = os.path.getsize(path)
+        name = pathlib.Path(path).stem
+        for i, start in enumerate(range(0, size, shard_bytes)):
+            shards.append((
+                path,
+                start,
+                min(start + shard_bytes, size),
+                columns > len(feature_columns_names),
+                f"{output_dir}/{name}-part-{i:05d}.csv",
+            ))
+    return shards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # overridable to run outside of a processing job, e.g. from the benchmarks
+    parser.add_argument("--base_dir", default="/opt/ml/processing")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard_mb", type=int, default=64)
+    parser.add_argument("--block_mb", type=int, default=4)
+    args, _ = parser.parse_known_args()
+    base_dir = args.base_dir
+
+    model_path = f"{base_dir}/model/model.tar.gz"
+    with tarfile.open(model_path) as tar:
+        tar.extractall(path=".")
+    model_file = os.path.abspath("xgboost-model")
+
+    preprocess = joblib.load(f"{base_dir}/transformer/preprocess.joblib")
+    params = compile_transformer(preprocess)
+
+    output_dir = f"{base_dir}/predictions"
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    shards = plan_shards(f"{base_dir}/input", output_dir, args.shard_mb * 1024 * 1024)
+    if not shards:
+        raise ValueError(f"No CSV files in {base_dir}/input")
+
+    # the NumPy path must match the fitted transformer before scoring anything with it
+    path, _, _, has_label, _ = shards[0]
+    first_block = next(read_blocks(path, 0, os.path.getsize(path), 64 * 1024))
+    numeric, sex = read_chunk(first_block, has_label)
+    sample = pd.DataFrame(numeric, columns=numeric_features)
+    sample.insert(0, "sex", sex)
+    if not np.allclose(transform(params, numeric, sex), preprocess.transform(sample)):
+        raise ValueError("Vectorized transform doesn't match the fitted preprocessing")
+
+    input_bytes = sum(os.path.getsize(path) for path in {shard[0] for shard in shards})
+    print(f"Scoring {input_bytes / 1e6:.1f} MB in {len(shards)} shards with {args.workers} workers")
+    started = time.perf_counter()
+    rows = 0
+    with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(model_file, params)) as pool:
+        futures = [pool.submit(score_shard, *shard, args.block_mb * 1024 * 1024) for shard in shards]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            rows += result["rows"]
+            elapsed = time.perf_counter() - started
+            print(
+                f"{done}/{len(shards)} shards, {rows} rows, {rows / elapsed:,.0f} rows/s "
+                f"(shard: {result['rows'] / result['seconds']:,.0f} rows/s)"
+            )
+    elapsed = time.perf_counter() - started
+
+    throughput = {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1),
+        "mb_per_second": round(input_bytes / 1e6 / elapsed, 2),
+        "workers": args.workers,
+        "shards": len(shards),
+    }
+    print(throughput)
+    with open(f"{output_dir}/throughput.json", "w") as f:
+        f.write(json.dumps(throughput))
@@ -1,3 +1,7 @@
+import argparse
+import pathlib
+
+import joblib
 import numpy as np
 import pandas as pd
 
@@ -40,7 +44,11 @@ def merge_two_dicts(x, y):
 
 
 if __name__ == "__main__":
-    base_dir = "/opt/ml/processing"
+    parser = argparse.ArgumentParser()
+    # overridable to run outside of a processing job, e.g. from the benchmarks
+    parser.add_argument("--base_dir", default="/opt/ml/processing")
+    args, _ = parser.parse_known_args()
+    base_dir = args.base_dir
 
     df = pd.read_csv(
         f"{base_dir}/input/abalone-dataset.csv",
@@ -71,6 +79,11 @@ if __name__ == "__main__":
 
     y = df.pop("rings")
     X_pre = preprocess.fit_transform(df)
+
+    # kept for code/batch_inference.py, the model only understands transformed features
+    transformer_dir = f"{base_dir}/transformer"
+    pathlib.Path(transformer_dir).mkdir(parents=True, exist_ok=True)
+    joblib.dump(preprocess, f"{transformer_dir}/preprocess.joblib")
     y_pre = y.to_numpy().reshape(len(y), 1)
 
     X = np.concatenate((y_pre, X_pre), axis=1)
@@ -0,0 +1 @@
+# Shared helpers for the LangChain and Langfuse notebooks, notebooks import them with sys.path.append("..")
@@ -0,0 +1,108 @@
+# Per-call overhead of SampledTracer with tracing off, sampled and full (sample_rate=1.0),
+# against langfuse's own @observe with --langfuse
+# cd notebooks && python -m rag_utils.bench_tracing --langfuse
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rag_utils.tracing import SampledTracer
+
+
+def null_exporter(events):
+    pass
+
+
+def no_op(**kwargs):
+    pass
+
+
+def build_workload(observe, update_current_trace, update_current_observation):
+    # a root observation with two nested ones, like main() -> call_openai() in 1_langfuse.ipynb
+    @observe(as_type="generation")
+    def call_llm(prompt):
+        update_current_observation(model="gpt-4o-mini", metadata={"max_tokens": 200})
+        update_current_trace(session_id="session", user_id="user", metadata={"is_openai": True})
+        return prompt.upper()
+
+    @observe()
+    def retrieve(query):
+        return [query] * 3
+
+    @observe()
+    def main(query):
+        return call_llm(f"{retrieve(query)}")
+
+    return main
+
+
+def time_per_call(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func("what is AI ?")
+    return (time.perf_counter() - start) / iterations
+
+
+class IngestionSink(BaseHTTPRequestHandler):
+    """Accepts every langfuse upload, so its background thread does the real HTTP work."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = b'{"successes": [], "errors": []}'
+        self.send_response(207)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def langfuse_instrumentation():
+    # langfuse.decorators against a local sink instead of a langfuse server
+    from langfuse.decorators import langfuse_context, observe
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), IngestionSink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    langfuse_context.configure(
+        public_key="pk-lf-bench", secret_key="sk-lf-bench", host=f"http://127.0.0.1:{server.server_port}"
+    )
+    return observe, langfuse_context.update_current_trace, langfuse_context.update_current_observation, langfuse_context
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--sample_rate", type=float, default=0.1)
+    parser.add_argument("--langfuse", action="store_true", help="Also time langfuse's @observe, needs langfuse<3")
+    args = parser.parse_args()
+
+    modes = {
+        "baseline": None,
+        "off": SampledTracer(null_exporter, enabled=False),
+        f"sampled_{args.sample_rate}": SampledTracer(null_exporter, sample_rate=args.sample_rate),
+        # every call recorded, exported to a no-op
+        "full": SampledTracer(null_exporter, sample_rate=1.0),
+    }
+    if args.langfuse:
+        modes["langfuse_observe"] = "langfuse"
+    results = {}
+    for mode, tracer in modes.items():
+        if tracer is None:
+            instrumentation = (lambda **kwargs: (lambda func: func)), no_op, no_op
+        elif tracer == "langfuse":
+            *instrumentation, langfuse_context = langfuse_instrumentation()
+        else:
+            instrumentation = tracer.observe, tracer.update_current_trace, tracer.update_current_observation
+        per_call = time_per_call(build_workload(*instrumentation), args.iterations)
+        results[mode] = {"us_per_call": round(per_call * 1e6, 3)}
+        if isinstance(tracer, SampledTracer):
+            tracer.shutdown()
+            results[mode].update(tracer.stats())
+        elif tracer == "langfuse":
+            langfuse_context.flush()
+    for mode, result in results.items():
+        result["overhead_us"] = round(result["us_per_call"] - results["baseline"]["us_per_call"], 3)
+    print(json.dumps(results, indent=2))
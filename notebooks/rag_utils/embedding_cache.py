@@ -0,0 +1,110 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model with an on-disk cache keyed by (model, content hash).
+
+    Only the texts that miss the cache are sent to the wrapped model, in
+    batches of `batch_size`, so re-running ingestion over unchanged chunks
+    costs no embedding calls. Queries are passed through uncached and don't
+    count towards the hit rate.
+
+        embeddings = CachedEmbeddings(OpenAIEmbeddings(), "../.cache/embeddings.sqlite")
+        Chroma.from_documents(documents, embedding=embeddings)
+        print(embeddings.stats())
+
+    For tests use langchain_core.embeddings.DeterministicFakeEmbedding as the model.
+    """
+
+    def __init__(self, embeddings, path, model_name=None, batch_size=256):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.embedding_calls = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        self._db.commit()
+
+    def _lookup(self, hashes):
+        found = {}
+        with self._lock:
+            # sqlite limits the number of bound parameters per statement
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(chunk))})",
+                    [self.model_name, *chunk],
+                )
+                found.update({key: array("f", vector).tolist() for key, vector in rows})
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            self.embedding_calls += 1
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            self._db.commit()
+
+    def embed_documents(self, texts):
+        hashes = [content_hash(text) for text in texts]
+        cached = self._lookup(sorted(set(hashes)))
+
+        # dedupe misses so repeated chunks are embedded once
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        miss_count = sum(1 for key in hashes if key not in cached)
+        with self._lock:
+            self.hits += len(texts) - miss_count
+            self.misses += miss_count
+
+        keys = list(missing)
+        for i in range(0, len(keys), self.batch_size):
+            batch = keys[i:i + self.batch_size]
+            vectors = self.embeddings.embed_documents([missing[key] for key in batch])
+            self._store(zip(batch, vectors))
+            cached.update(zip(batch, vectors))
+
+        return [list(cached[key]) for key in hashes]
+
+    def embed_query(self, text):
+        # not cached: queries rarely repeat, would add an sqlite write per query and
+        # some models embed queries differently from documents
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "embedding_calls": self.embedding_calls,
+        }
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from rag_utils.rate_limit import RateLimiter
+
+
+def exact_match_batch(outputs, expected_outputs):
+    """Vectorized simple_evaluation, scores a whole experiment at once."""
+    return (np.asarray(outputs, dtype=str) == np.asarray(expected_outputs, dtype=str)).tolist()
+
+
+class RunState:
+    """Append-only JSONL log of finished (experiment, item) outputs and scores, for resuming."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.outputs = {}
+        self.scores = {}
+        if path and os.path.exists(path):
+            self._load()
+        elif path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            lines = f.readlines()
+        valid_bytes = 0
+        for i, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if i < len(lines) - 1:
+                    raise
+                # a crash in the middle of _append, drop the partial record so new ones start on a fresh line
+                print(f"Dropping truncated last line of {self.path}")
+                with open(self.path, "r+b") as f:
+                    f.truncate(valid_bytes)
+                break
+            valid_bytes += len(line)
+            key = (record["experiment"], record["item_id"])
+            if record["type"] == "output":
+                self.outputs[key] = record
+            else:
+                self.scores[key] = record["score"]
+        else:
+            if lines and not lines[-1].endswith(b"\n"):
+                # complete record, only the newline was lost
+                with open(self.path, "ab") as f:
+                    f.write(b"\n")
+
+    def _append(self, record):
+        if not self.path:
+            return
+        with self.lock, open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def add_output(self, experiment, item_id, trace_id, output):
+        record = {"type": "output", "experiment": experiment, "item_id": item_id, "trace_id": trace_id, "output": output}
+        with self.lock:
+            self.outputs[(experiment, item_id)] = record
+        self._append(record)
+
+    def add_scores(self, experiment, item_ids, scores):
+        with self.lock:
+            self.scores.update({(experiment, item_id): score for item_id, score in zip(item_ids, scores)})
+        for item_id, score in zip(item_ids, scores):
+            self._append({"type": "score", "experiment": experiment, "item_id": item_id, "score": score})
+
+
+class ExperimentRunner:
+    """Runs several system prompt experiments over a Langfuse dataset concurrently.
+
+    All (experiment, item) pairs share one thread pool of `max_concurrency`
+    workers and an optional `requests_per_second` limit. Once an experiment's
+    outputs are in, they are scored in one `evaluate_batch` call and the
+    scores are attached to the item traces. Traces are flushed every
+    `flush_every` items instead of per experiment.
+
+    With `state_path` every output and score is logged as it completes, a
+    re-run skips what is already done and only scores what is missing.
+
+    Only uses langfuse.get_dataset(name).items (id, input, expected_output,
+    get_langchain_handler(run_name=...)), handler.trace.id, langfuse.score and
+    langfuse.flush, so a local stand-in with those methods works for tests.
+
+        runner = ExperimentRunner(langfuse, "capital_cities", get_llm_output, state_path="../.cache/runs.jsonl")
+        runner.run({"langchain_asking_specifically": "The user will input countries, ..."})
+    """
+
+    def __init__(
+        self,
+        langfuse,
+        dataset_name,
+        get_output,
+        evaluate_batch=exact_match_batch,
+        score_name="exact_match",
+        input_key="country",
+        max_concurrency=8,
+        requests_per_second=None,
+        flush_every=50,
+        state_path=None,
+    ):
+        self.langfuse = langfuse
+        self.dataset_name = dataset_name
+        self.get_output = get_output
+        self.evaluate_batch = evaluate_batch
+        self.score_name = score_name
+        self.input_key = input_key
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_second) if requests_per_second else None
+        self.flush_every = flush_every
+        self.state = RunState(state_path)
+        self._completed = 0
+        self._lock = threading.Lock()
+
+    def _run_item(self, experiment_name, system_message, item):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        langfuse_handler = item.get_langchain_handler(run_name=experiment_name)
+        completion = self.get_output(
+            input_message=item.input[self.input_key],
+            system_message=system_message,
+            langfuse_handler=langfuse_handler,
+        )
+        self.state.add_output(experiment_name, item.id, langfuse_handler.trace.id, completion)
+
+        with self._lock:
+            self._completed += 1
+            flush = self._completed % self.flush_every == 0
+        if flush:
+            self.langfuse.flush()
+
+    def _score(self, experiment_name, items):
+        to_score = [
+            item for item in items
+            if (experiment_name, item.id) in self.state.outputs and (experiment_name, item.id) not in self.state.scores
+        ]
+        if not to_score:
+            return
+        records = [self.state.outputs[(experiment_name, item.id)] for item in to_score]
+        scores = self.evaluate_batch(
+            [record["output"] for record in records], [item.expected_output for item in to_score]
+        )
+        for record, score in zip(records, scores):
+            self.langfuse.score(trace_id=record["trace_id"], name=self.score_name, value=score, data_type="BOOLEAN")
+        self.state.add_scores(experiment_name, [item.id for item in to_score], scores)
+
+    def run(self, experiments):
+        """Runs {experiment name: system message}, returns {experiment name: mean score}."""
+        items = self.langfuse.get_dataset(name=self.dataset_name).items
+        pending = [
+            (experiment_name, system_message, item)
+            for experiment_name, system_message in experiments.items()
+            for item in items
+            if (experiment_name, item.id) not in self.state.outputs
+        ]
+        print(f"{len(experiments) * len(items) - len(pending)} item runs already done, {len(pending)} to go")
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {pool.submit(self._run_item, *args): args for args in pending}
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    experiment_name, _, item = futures[future]
+                    errors.append((experiment_name, item.id, future.exception()))
+
+        results = {}
+        for experiment_name in experiments:
+            self._score(experiment_name, items)
+            scores = [
+                self.state.scores[(experiment_name, item.id)]
+                for item in items
+                if (experiment_name, item.id) in self.state.scores
+            ]
+            results[experiment_name] = sum(scores) / len(scores) if scores else None
+        self.langfuse.flush()
+
+        for experiment_name, item_id, error in errors:
+            print(f"{experiment_name} / {item_id} failed, re-run to retry: {error}")
+        print(results)
+        return results
@@ -0,0 +1,261 @@
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from rag_utils.rate_limit import RateLimiter
+from rag_utils.vector_index import chunk_id
+
+
+DONE = object()
+
+
+def split_documents(text_splitter, docs):
+    # module level so it can be pickled into the split process pool, timed in the worker
+    start = time.monotonic()
+    chunks = text_splitter.split_documents(docs)
+    return chunks, time.monotonic() - start
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        # time spent waiting on a full output queue, i.e. backpressure from the next stage
+        self.blocked_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def add(self, items_in=0, items_out=0, busy=0.0, blocked=0.0):
+        with self.lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+
+    def as_dict(self):
+        elapsed = (self.finished or time.monotonic()) - (self.started or time.monotonic())
+        return {
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "items_out_per_sec": self.items_out / elapsed if elapsed > 0 else 0.0,
+            "busy_s": round(self.busy_seconds, 3),
+            "blocked_on_output_s": round(self.blocked_seconds, 3),
+            "elapsed_s": round(elapsed, 3),
+        }
+
+
+class IngestionPipeline:
+    """Streams documents through load -> split -> embed -> store concurrently.
+
+    Stages are connected by bounded queues so a slow stage holds back the
+    ones before it instead of buffering the whole corpus in memory:
+
+    * load: iterates `documents` (e.g. WikipediaLoader(...).lazy_load()) in a thread
+    * split: runs `text_splitter` in a process pool
+    * embed: `embed_workers` threads embedding batches of chunks, rate limited
+    * store: upserts precomputed embeddings into the Chroma collection in batches
+
+    Chunks get the same stable ids as vector_index.sync_documents and ids
+    already in the collection are not embedded again.
+
+        pipeline = IngestionPipeline(text_splitter, embeddings, vectorstore)
+        report = pipeline.run(WikipediaLoader(query="Artificial intelligence").lazy_load())
+    """
+
+    def __init__(
+        self,
+        text_splitter,
+        embedding,
+        vectorstore,
+        split_workers=2,
+        embed_workers=4,
+        embed_batch_size=64,
+        requests_per_second=10,
+        write_batch_size=256,
+        queue_size=8,
+        skip_existing=True,
+    ):
+        self.text_splitter = text_splitter
+        self.embedding = embedding
+        self.collection = vectorstore._collection
+        self.split_workers = split_workers
+        self.embed_workers = embed_workers
+        self.embed_batch_size = embed_batch_size
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.skip_existing = skip_existing
+
+    def _put(self, q, item, stats):
+        start = time.monotonic()
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.add(blocked=time.monotonic() - start)
+        self._max_depth[id(q)] = max(self._max_depth.get(id(q), 0), q.qsize())
+
+    def _get(self, q):
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def _run_stage(self, stats, target, *args):
+        stats.started = stats.started or time.monotonic()
+        try:
+            target(stats, *args)
+        except BaseException as e:
+            self._errors.append(e)
+            self._abort.set()
+        finally:
+            stats.finished = time.monotonic()
+
+    def _load(self, stats, documents):
+        for doc in documents:
+            if self._abort.is_set():
+                return
+            stats.add(items_out=1)
+            self._put(self._docs, doc, stats)
+        self._put(self._docs, DONE, stats)
+
+    def _split(self, stats):
+        max_pending = 2 * self.split_workers
+        # spawn: forking a kernel with live threads, sqlite and chroma handles can deadlock the children
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.split_workers, mp_context=context) as pool:
+            pending = deque()
+
+            def emit(future):
+                chunks, busy = future.result()
+                stats.add(items_out=len(chunks), busy=busy)
+                for chunk in chunks:
+                    self._put(self._chunks, chunk, stats)
+
+            while True:
+                doc = self._get(self._docs)
+                if doc is DONE:
+                    break
+                stats.add(items_in=1)
+                pending.append(pool.submit(split_documents, self.text_splitter, [doc]))
+                # keep at most max_pending documents in flight, emitting in load order
+                while pending and (len(pending) >= max_pending or pending[0].done()):
+                    emit(pending.popleft())
+            while pending:
+                emit(pending.popleft())
+        for _ in range(self.embed_workers):
+            self._put(self._chunks, DONE, stats)
+
+    def _embed_batch(self, stats, chunks):
+        ids = [chunk_id(chunk) for chunk in chunks]
+        unique = dict(zip(ids, chunks))
+        if self.skip_existing:
+            for id_ in self.collection.get(ids=list(unique), include=[])["ids"]:
+                unique.pop(id_, None)
+        if not unique:
+            return
+        self.rate_limiter.acquire()
+        start = time.monotonic()
+        vectors = self.embedding.embed_documents([chunk.page_content for chunk in unique.values()])
+        stats.add(items_out=len(unique), busy=time.monotonic() - start)
+        self._put(self._vectors, (list(unique), list(unique.values()), vectors), stats)
+
+    def _embed(self, stats):
+        batch = []
+        while True:
+            chunk = self._get(self._chunks)
+            if chunk is DONE:
+                break
+            stats.add(items_in=1)
+            batch.append(chunk)
+            if len(batch) >= self.embed_batch_size:
+                self._embed_batch(stats, batch)
+                batch = []
+        if batch:
+            self._embed_batch(stats, batch)
+        self._put(self._vectors, DONE, stats)
+
+    def _write(self, stats, ids, chunks, vectors):
+        start = time.monotonic()
+        self.collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[chunk.page_content for chunk in chunks],
+            # chroma rejects empty metadata dicts
+            metadatas=[chunk.metadata or None for chunk in chunks],
+        )
+        stats.add(items_out=len(ids), busy=time.monotonic() - start)
+
+    def _store(self, stats):
+        ids, chunks, vectors = [], [], []
+        remaining_workers = self.embed_workers
+        while remaining_workers:
+            item = self._get(self._vectors)
+            if item is DONE:
+                if self._abort.is_set():
+                    return
+                remaining_workers -= 1
+                continue
+            stats.add(items_in=len(item[0]))
+            ids.extend(item[0])
+            chunks.extend(item[1])
+            vectors.extend(item[2])
+            if len(ids) >= self.write_batch_size:
+                self._write(stats, ids, chunks, vectors)
+                ids, chunks, vectors = [], [], []
+        if ids:
+            self._write(stats, ids, chunks, vectors)
+
+    def run(self, documents):
+        """Ingests `documents` and returns per-stage throughput and backpressure."""
+        self._abort = threading.Event()
+        self._errors = []
+        self._max_depth = {}
+        self._docs = queue.Queue(self.queue_size)
+        self._chunks = queue.Queue(self.queue_size * self.embed_batch_size)
+        self._vectors = queue.Queue(self.queue_size)
+
+        stats = {name: StageStats(name) for name in ("load", "split", "embed", "store")}
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=self._run_stage, args=(stats["load"], self._load, documents)),
+            threading.Thread(target=self._run_stage, args=(stats["split"], self._split)),
+            *[
+                threading.Thread(target=self._run_stage, args=(stats["embed"], self._embed))
+                for _ in range(self.embed_workers)
+            ],
+            threading.Thread(target=self._run_stage, args=(stats["store"], self._store)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+        report = {
+            "elapsed_s": round(time.monotonic() - start, 3),
+            "stages": {name: stage.as_dict() for name, stage in stats.items()},
+            "max_queue_depth": {
+                "docs": self._max_depth.get(id(self._docs), 0),
+                "chunks": self._max_depth.get(id(self._chunks), 0),
+                "vectors": self._max_depth.get(id(self._vectors), 0),
+            },
+        }
+        print(f"{'stage':<8}{'in':>8}{'out':>8}{'out/s':>10}{'busy (s)':>10}{'blocked (s)':>13}")
+        for name, stage in report["stages"].items():
+            print(
+                f"{name:<8}{stage['items_in']:>8}{stage['items_out']:>8}{stage['items_out_per_sec']:>10.1f}"
+                f"{stage['busy_s']:>10.2f}{stage['blocked_on_output_s']:>13.2f}"
+            )
+        return report
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, fields
+
+from langchain_core.prompts import ChatPromptTemplate
+
+
+@dataclass(frozen=True)
+class CachedPrompt:
+    name: str
+    label: str
+    version: int
+    prompt: object
+    langchain_prompt: object
+    config: dict
+    fetched_at: float
+    template: ChatPromptTemplate = field(default=None, compare=False)
+
+
+def compile_prompt(name, label, version, prompt, langchain_prompt, config, fetched_at):
+    if isinstance(langchain_prompt, str):
+        template = ChatPromptTemplate.from_template(langchain_prompt)
+    else:
+        template = ChatPromptTemplate.from_messages([tuple(message) for message in langchain_prompt])
+    return CachedPrompt(name, label, version, prompt, langchain_prompt, config, fetched_at, template)
+
+
+class PromptRegistry:
+    """In-process cache of compiled Langfuse prompts with stale-while-revalidate.
+
+    `get` returns from memory, prompts older than `ttl_seconds` are served
+    as is while a background thread fetches the new version, so a slow or
+    unavailable Langfuse never sits on the request path. Only the very first
+    lookup of a prompt (with no snapshot on disk) waits for the backend.
+
+    With `snapshot_path` the compiled prompts are written to disk after every
+    refresh and loaded on startup, so a cold process can serve prompts before
+    Langfuse answers.
+
+        registry = PromptRegistry(langfuse, ttl_seconds=30, snapshot_path="../.cache/prompts.json")
+        rag_prompt = registry.get("rag-base-prompt-with-context")
+        rag_prompt.template, rag_prompt.config
+    """
+
+    def __init__(self, langfuse, ttl_seconds=60, snapshot_path=None):
+        self.langfuse = langfuse
+        self.ttl_seconds = ttl_seconds
+        self.snapshot_path = snapshot_path
+        self.prompts = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._load_snapshot()
+
+    def _fetch(self, name, label):
+        # our own cache sits in front, so always ask the backend
+        prompt = self.langfuse.get_prompt(name, label=label, cache_ttl_seconds=0)
+        return compile_prompt(
+            name, label, prompt.version, prompt.prompt, prompt.get_langchain_prompt(), prompt.config, time.time()
+        )
+
+    def _refresh(self, name, label):
+        try:
+            cached = self._fetch(name, label)
+            with self._lock:
+                self.prompts[(name, label)] = cached
+                self.refreshes += 1
+            self._save_snapshot()
+        except Exception as e:
+            with self._lock:
+                self.refresh_errors += 1
+            print(f"Refreshing prompt '{name}' ({label}) failed, serving the cached version: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard((name, label))
+
+    def _refresh_in_background(self, name, label):
+        with self._lock:
+            if (name, label) in self._refreshing:
+                return
+            self._refreshing.add((name, label))
+        threading.Thread(target=self._refresh, args=(name, label), daemon=True).start()
+
+    def get(self, name, label="production"):
+        cached = self.prompts.get((name, label))
+        if cached is None:
+            # nothing to serve yet, the only lookup that waits for Langfuse
+            cached = self._fetch(name, label)
+            with self._lock:
+                self.prompts[(name, label)] = cached
+            self._save_snapshot()
+            return cached
+
+        if time.time() - cached.fetched_at > self.ttl_seconds:
+            self.stale_hits += 1
+            self._refresh_in_background(name, label)
+        else:
+            self.hits += 1
+        return cached
+
+    def stats(self):
+        return {
+            "prompts": len(self.prompts),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        with open(self.snapshot_path) as f:
+            for entry in json.load(f):
+                cached = compile_prompt(**entry)
+                self.prompts[(cached.name, cached.label)] = cached
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            entries = [
+                {f.name: getattr(cached, f.name) for f in fields(cached) if f.name != "template"}
+                for cached in self.prompts.values()
+            ]
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, indent=2)
+            os.replace(tmp_path, self.snapshot_path)
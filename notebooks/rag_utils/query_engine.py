@@ -0,0 +1,157 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnablePassthrough
+
+from rag_utils.rate_limit import AsyncRateLimiter
+
+
+@dataclass
+class QueryResult:
+    index: int
+    question: str
+    answer: str = None
+    error: str = None
+    attempts: int = 0
+    latency_s: float = 0.0
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+class AsyncRagEngine:
+    """Answers a stream of questions with the notebooks' RAG chain, concurrently.
+
+    Runs `{"context": retriever, "question": RunnablePassthrough()} | prompt | llm | StrOutputParser()`
+    with `ainvoke`, at most `max_concurrency` questions in flight and
+    optionally at most `requests_per_second` chain calls started per second.
+    Failed calls are retried with exponential backoff, a question that still
+    fails is returned with `error` set instead of aborting the run.
+
+        engine = AsyncRagEngine(retriever, prompt, llm, max_concurrency=32)
+        results, report = await engine.arun(questions)
+
+    Any retriever / chat model works, e.g. FakeListChatModel for tests.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        prompt,
+        llm,
+        max_concurrency=16,
+        requests_per_second=None,
+        max_retries=3,
+        retry_backoff_s=0.5,
+        config=None,
+    ):
+        self.chain = {"context": retriever, "question": RunnablePassthrough()} | prompt | llm | StrOutputParser()
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.retry_backoff_s = retry_backoff_s
+        self.config = config
+
+    async def _answer(self, index, question, rate_limiter):
+        result = QueryResult(index=index, question=question)
+        start = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            result.attempts = attempt + 1
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                result.answer = await self.chain.ainvoke(question, config=self.config)
+                result.error = None
+                break
+            except Exception as e:
+                result.error = f"{type(e).__name__}: {e}"
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self.retry_backoff_s * 2**attempt)
+        result.latency_s = time.monotonic() - start
+        return result
+
+    async def astream(self, questions, ordered=True):
+        """Yields a QueryResult per question, in input order or as soon as each finishes.
+
+        `questions` can be any (possibly lazy) iterable, only `max_concurrency`
+        questions are pulled from it ahead of the answers. If iterating it
+        raises, the questions pulled so far are answered and then the error
+        is raised.
+        """
+        rate_limiter = AsyncRateLimiter(self.requests_per_second) if self.requests_per_second else None
+        inputs = asyncio.Queue(self.max_concurrency)
+        outputs = asyncio.Queue()
+
+        feed_errors = []
+
+        async def feed():
+            try:
+                for index, question in enumerate(questions):
+                    await inputs.put((index, question))
+            except Exception as e:
+                # re-raised once the questions already queued are answered
+                feed_errors.append(e)
+            finally:
+                # always stop the workers, or a failing iterable would hang the run
+                for _ in range(self.max_concurrency):
+                    await inputs.put(None)
+
+        async def work():
+            while (item := await inputs.get()) is not None:
+                await outputs.put(await self._answer(*item, rate_limiter))
+            await outputs.put(None)
+
+        tasks = [asyncio.create_task(feed())]
+        tasks += [asyncio.create_task(work()) for _ in range(self.max_concurrency)]
+        try:
+            # results that finished ahead of an earlier question when ordered=True
+            pending = {}
+            next_index = 0
+            running = self.max_concurrency
+            while running:
+                result = await outputs.get()
+                if result is None:
+                    running -= 1
+                    continue
+                if not ordered:
+                    yield result
+                    continue
+                pending[result.index] = result
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+            if feed_errors:
+                raise feed_errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def arun(self, questions, ordered=True):
+        """Answers all `questions`, returns (results, report)."""
+        start = time.monotonic()
+        results = [result async for result in self.astream(questions, ordered=ordered)]
+        elapsed = time.monotonic() - start
+
+        latencies = [result.latency_s for result in results if result.error is None]
+        report = {
+            "queries": len(results),
+            "errors": sum(1 for result in results if result.error is not None),
+            "retries": sum(result.attempts - 1 for result in results),
+            "elapsed_s": round(elapsed, 3),
+            "queries_per_sec": len(results) / elapsed if elapsed > 0 else 0.0,
+            "latency_p50_s": percentile(latencies, 50),
+            "latency_p90_s": percentile(latencies, 90),
+            "latency_p99_s": percentile(latencies, 99),
+        }
+        print(report)
+        return results, report
+
+    def run(self, questions, ordered=True):
+        # outside of notebooks, which already run an event loop and should use arun
+        return asyncio.run(self.arun(questions, ordered=ordered))
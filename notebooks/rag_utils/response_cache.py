@@ -0,0 +1,261 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from langchain_core.runnables import Runnable
+
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    return WHITESPACE.sub(" ", str(text)).strip().lower()
+
+
+def normalized_messages(prompt_value):
+    """(role, whitespace collapsed and lowercased content) of every message of a prompt."""
+    if hasattr(prompt_value, "to_messages"):
+        messages = [(message.type, message.content) for message in prompt_value.to_messages()]
+    else:
+        messages = [("human", str(prompt_value))]
+    return [(role, normalize_text(content)) for role, content in messages]
+
+
+def normalize_prompt(prompt_value):
+    """Role-tagged, whitespace collapsed and lowercased text of a prompt."""
+    return "\n".join(f"{role}: {content}" for role, content in normalized_messages(prompt_value))
+
+
+def last_human_message(prompt_value):
+    """Text of the last human message, the whole prompt for plain string prompts."""
+    if hasattr(prompt_value, "to_messages"):
+        for message in reversed(prompt_value.to_messages()):
+            if message.type == "human":
+                return str(message.content)
+    return str(prompt_value)
+
+
+@dataclass
+class CacheEntry:
+    scope: str
+    response: object
+    vector: np.ndarray
+    created_at: float
+
+
+class TierStats:
+    def __init__(self):
+        self.hits = 0
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "mean_lookup_ms": 1000 * self.lookup_seconds / self.lookups if self.lookups else 0.0,
+        }
+
+
+class ResponseCache(Runnable):
+    """Two tier response cache in front of a chat model, usable anywhere in a chain.
+
+        cached_llm = ResponseCache(llm, embeddings)
+        rag_chain = {"context": retriever, "question": RunnablePassthrough()} | prompt | cached_llm | StrOutputParser()
+
+    1. exact: the normalized prompt plus the model parameters and `namespace`
+    2. semantic: the most similar cached query in the same scope, if its cosine
+       similarity to the query embedding is >= `similarity_threshold`. The scope
+       is the model parameters, `namespace` and the rest of the prompt (system
+       prompt, template text, retrieved context), so a cache shared by chains
+       with different prompts never answers one with the other's responses.
+
+    The query is `query(prompt_value)`, by default the last human message. Only
+    the question should be embedded: a retrieved context shared by two different
+    questions would otherwise make their prompts look alike. Keep the context out
+    of the human message, e.g. in a system message. With the default `query`,
+    a prompt that is nothing but the human message skips the semantic tier
+    with a warning; pass `query=last_human_message` if it really is just the
+    question.
+
+    Entries are evicted least recently used beyond `max_entries` and after
+    `ttl_seconds`. Only cache deterministic (temperature=0) models, otherwise
+    every caller gets the first sampled answer.
+    """
+
+    def __init__(
+        self,
+        llm,
+        embedding=None,
+        similarity_threshold=0.95,
+        max_entries=10_000,
+        ttl_seconds=None,
+        query=None,
+        namespace="",
+    ):
+        self.llm = llm
+        self.embedding = embedding
+        self.query = query or last_human_message
+        self.check_query = query is None
+        self.namespace = namespace
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.params_key = json.dumps(getattr(llm, "_identifying_params", {}), sort_keys=True, default=str)
+        self.entries = OrderedDict()
+        self.exact_stats = TierStats()
+        self.semantic_stats = TierStats()
+        self.misses = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+        # scope -> (keys, stacked unit vectors) of self.entries, rebuilt lazily after a change
+        self._matrices = {}
+        self._warned_whole_prompt = False
+
+    def _key(self, prompt_text):
+        return hashlib.sha256(f"{self.params_key}\n{self.namespace}\n{prompt_text}".encode("utf-8")).hexdigest()
+
+    def _semantic_scope(self, input, query_text):
+        """Hash of everything in the prompt but the query, None if the query is the whole prompt."""
+        rest = []
+        found = False
+        for role, content in reversed(normalized_messages(input)):
+            if not found and query_text in content:
+                content = content.replace(query_text, "", 1).strip()
+                found = True
+            rest.append(f"{role}: {content}")
+        if self.check_query and not any(line.split(": ", 1)[1] for line in rest):
+            if not self._warned_whole_prompt:
+                warnings.warn(
+                    "ResponseCache: the query is the whole prompt, skipping the semantic tier. "
+                    "Move the context out of the human message or pass `query`."
+                )
+                self._warned_whole_prompt = True
+            return None
+        scope = "\n".join([self.params_key, self.namespace, *reversed(rest)])
+        return hashlib.sha256(scope.encode("utf-8")).hexdigest()
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds
+
+    def _lookup_exact(self, key):
+        start = time.perf_counter()
+        with self._lock:
+            self.exact_stats.lookups += 1
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry, time.time()):
+                del self.entries[key]
+                self._matrices.clear()
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.exact_stats.hits += 1
+            self.exact_stats.lookup_seconds += time.perf_counter() - start
+        return entry
+
+    def _lookup_semantic(self, vector, scope):
+        start = time.perf_counter()
+        with self._lock:
+            self.semantic_stats.lookups += 1
+            if scope not in self._matrices:
+                keys = [
+                    key for key, entry in self.entries.items()
+                    if entry.scope == scope and entry.vector is not None
+                ]
+                self._matrices[scope] = (keys, np.stack([self.entries[key].vector for key in keys]) if keys else None)
+            keys, matrix = self._matrices[scope]
+            entry = None
+            if matrix is not None:
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                key = keys[best]
+                candidate = self.entries.get(key)
+                if (
+                    similarities[best] >= self.similarity_threshold
+                    and candidate is not None
+                    and not self._expired(candidate, time.time())
+                ):
+                    entry = candidate
+                    self.entries.move_to_end(key)
+                    self.semantic_stats.hits += 1
+            self.semantic_stats.lookup_seconds += time.perf_counter() - start
+        return entry
+
+    def _store(self, key, response, vector, scope):
+        with self._lock:
+            self.entries[key] = CacheEntry(scope, response, vector, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._matrices.clear()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def invoke(self, input, config=None, **kwargs):
+        prompt_text = normalize_prompt(input)
+        key = self._key(prompt_text)
+        entry = self._lookup_exact(key)
+        if entry is not None:
+            return entry.response
+
+        vector, scope = None, None
+        if self.embedding is not None:
+            query_text = normalize_text(self.query(input))
+            scope = self._semantic_scope(input, query_text)
+        if scope is not None:
+            vector = self._unit(self.embedding.embed_query(query_text))
+            entry = self._lookup_semantic(vector, scope)
+            if entry is not None:
+                return entry.response
+
+        start = time.perf_counter()
+        response = self.llm.invoke(input, config=config, **kwargs)
+        with self._lock:
+            self.misses += 1
+            self.llm_seconds += time.perf_counter() - start
+        self._store(key, response, vector, scope)
+        return response
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        prompt_text = normalize_prompt(input)
+        key = self._key(prompt_text)
+        entry = self._lookup_exact(key)
+        if entry is not None:
+            return entry.response
+
+        vector, scope = None, None
+        if self.embedding is not None:
+            query_text = normalize_text(self.query(input))
+            scope = self._semantic_scope(input, query_text)
+        if scope is not None:
+            vector = self._unit(await self.embedding.aembed_query(query_text))
+            entry = self._lookup_semantic(vector, scope)
+            if entry is not None:
+                return entry.response
+
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(input, config=config, **kwargs)
+        with self._lock:
+            self.misses += 1
+            self.llm_seconds += time.perf_counter() - start
+        self._store(key, response, vector, scope)
+        return response
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "exact": self.exact_stats.as_dict(),
+            "semantic": self.semantic_stats.as_dict(),
+            "misses": self.misses,
+            "mean_llm_ms": 1000 * self.llm_seconds / self.misses if self.misses else 0.0,
+        }
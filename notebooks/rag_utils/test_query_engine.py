@@ -0,0 +1,43 @@
+# python -m pytest rag_utils (from notebooks/)
+import asyncio
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from rag_utils.query_engine import AsyncRagEngine
+
+
+def make_engine(**kwargs):
+    retriever = RunnableLambda(lambda question: f"context for {question}")
+    prompt = ChatPromptTemplate.from_messages([("human", "{context}\n\n{question}")])
+    llm = FakeListChatModel(responses=["answer"])
+    return AsyncRagEngine(retriever, prompt, llm, max_concurrency=4, **kwargs)
+
+
+def test_answers_in_input_order():
+    questions = [f"question {i}" for i in range(10)]
+    results, report = make_engine().run(questions)
+
+    assert [result.question for result in results] == questions
+    assert all(result.answer == "answer" and result.error is None for result in results)
+    assert report["queries"] == 10
+
+
+def test_failing_question_iterable_raises_instead_of_hanging():
+    def questions():
+        yield "what is AI ?"
+        raise RuntimeError("question source failed")
+
+    async def run():
+        engine = make_engine()
+        answered = []
+        with pytest.raises(RuntimeError, match="question source failed"):
+            async for result in engine.astream(questions()):
+                answered.append(result)
+        return answered
+
+    answered = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    # the question pulled before the failure is still answered
+    assert [result.question for result in answered] == ["what is AI ?"]
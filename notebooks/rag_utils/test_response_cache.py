@@ -0,0 +1,94 @@
+# python -m pytest rag_utils (from notebooks/)
+import zlib
+
+import numpy as np
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from rag_utils.response_cache import ResponseCache
+
+
+CONTEXT = " ".join(["Artificial intelligence is the capability of computational systems to perform tasks"] * 12)
+
+
+class FakeEmbeddings:
+    """Bag of words hashed into a fixed number of dimensions, similar texts get similar vectors."""
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        vector = np.zeros(self.dimensions)
+        for word in text.split():
+            vector[zlib.crc32(word.encode()) % self.dimensions] += 1
+        return vector.tolist()
+
+
+def make_cache():
+    calls = []
+
+    def llm(prompt_value):
+        calls.append(prompt_value)
+        return AIMessage(content=f"answer {len(calls)}")
+
+    return ResponseCache(RunnableLambda(llm), FakeEmbeddings(), similarity_threshold=0.95), calls
+
+
+def test_same_context_different_questions_do_not_collide():
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Answer the question using the provided context only.\n\nContext:\n{context}"),
+        ("human", "{question}"),
+    ])
+    cache, calls = make_cache()
+
+    first = cache.invoke(prompt.invoke({"context": CONTEXT, "question": "what is AI ?"}))
+    second = cache.invoke(prompt.invoke({"context": CONTEXT, "question": "who invented AI ?"}))
+
+    assert first.content != second.content
+    assert len(calls) == 2
+    assert cache.stats()["semantic"]["hits"] == 0
+    # only the questions are embedded, not the shared context
+    assert cache.embedding.queries == ["what is ai ?", "who invented ai ?"]
+
+
+def test_rephrased_question_hits_semantic_tier():
+    prompt = ChatPromptTemplate.from_messages([("system", "Context:\n{context}"), ("human", "{question}")])
+    cache, calls = make_cache()
+
+    first = cache.invoke(prompt.invoke({"context": CONTEXT, "question": "what is AI ?"}))
+    # same words in another order: a different exact key, the same embedding
+    second = cache.invoke(prompt.invoke({"context": CONTEXT, "question": "AI ? what is"}))
+
+    assert second.content == first.content
+    assert len(calls) == 1
+    assert cache.stats()["exact"]["hits"] == 0
+    assert cache.stats()["semantic"]["hits"] == 1
+
+
+def test_chains_with_different_prompts_do_not_share_answers():
+    english = ChatPromptTemplate.from_messages([("system", "Answer in English.\n{context}"), ("human", "{question}")])
+    french = ChatPromptTemplate.from_messages([("system", "Answer in French.\n{context}"), ("human", "{question}")])
+    cache, calls = make_cache()
+
+    cache.invoke(english.invoke({"context": CONTEXT, "question": "what is AI ?"}))
+    cache.invoke(french.invoke({"context": CONTEXT, "question": "AI ? what is"}))
+
+    assert len(calls) == 2
+    assert cache.stats()["semantic"]["hits"] == 0
+
+
+def test_query_covering_the_whole_prompt_skips_semantic_tier():
+    # question and context in one human message, embedding it would compare contexts
+    prompt = ChatPromptTemplate.from_messages([("human", "{question}\n\nContext:\n{context}")])
+    cache, calls = make_cache()
+
+    with pytest.warns(UserWarning, match="whole prompt"):
+        cache.invoke(prompt.invoke({"context": CONTEXT, "question": "what is AI ?"}))
+    cache.invoke(prompt.invoke({"context": CONTEXT, "question": "who invented AI ?"}))
+
+    assert len(calls) == 2
+    assert cache.embedding.queries == []
@@ -0,0 +1,290 @@
+import contextvars
+import functools
+import inspect
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+
+class _Observation:
+    __slots__ = ("trace_id", "id", "trace", "attributes")
+
+    def __init__(self, trace_id, observation_id, trace):
+        self.trace_id = trace_id
+        self.id = observation_id
+        # attributes set with update_current_trace, one dict shared by all observations of the trace
+        self.trace = trace
+        # set with update_current_observation, None until then to keep the common path cheap
+        self.attributes = None
+
+
+# innermost sampled _Observation, None outside of a trace
+_current = contextvars.ContextVar("sampled_tracer_current", default=None)
+# set to NOT_SAMPLED for traces the head sampler dropped, so nested calls skip all work
+_NOT_SAMPLED = _Observation("", "", None)
+
+
+class LangfuseExporter:
+    """Sends batches of recorded observations with the low level Langfuse client.
+
+    Attributes from update_current_trace / update_current_observation (e.g.
+    session_id, user_id, model, metadata) are passed through as keyword
+    arguments of langfuse.trace / langfuse.generation / langfuse.span.
+    """
+
+    def __init__(self, langfuse):
+        self.langfuse = langfuse
+
+    def __call__(self, events):
+        for event in events:
+            (
+                trace_id, observation_id, parent_id, name, as_type, start, end, args, output, error,
+                attributes, trace_attributes,
+            ) = event
+            start_time = datetime.fromtimestamp(start, tz=timezone.utc)
+            end_time = datetime.fromtimestamp(end, tz=timezone.utc)
+            if parent_id is None:
+                self.langfuse.trace(**{
+                    "id": trace_id,
+                    "name": name,
+                    "input": args,
+                    "output": output,
+                    "timestamp": start_time,
+                    **(trace_attributes or {}),
+                })
+            observation = self.langfuse.generation if as_type == "generation" else self.langfuse.span
+            observation(**{
+                "id": observation_id,
+                "trace_id": trace_id,
+                "parent_observation_id": parent_id,
+                "name": name,
+                "start_time": start_time,
+                "end_time": end_time,
+                "input": args,
+                "output": output,
+                "level": "ERROR" if error else "DEFAULT",
+                "status_message": error,
+                **(attributes or {}),
+            })
+
+
+class SampledTracer:
+    """Low overhead replacement for langfuse's @observe.
+
+    * head sampling: whether a trace is recorded is decided once at its root
+      call with probability `sample_rate`, nested calls of a dropped trace only
+      pay a contextvar lookup
+    * the request path only appends a tuple to an in-process deque (atomic
+      under the GIL, no lock); nothing is serialized or sent there
+    * a background thread hands batches of up to `batch_size` events to the
+      exporter when a batch is full or every `flush_interval_s`
+    * at most `max_buffered` events are held, beyond that new events are
+      dropped and counted instead of blocking the caller
+
+        tracer = SampledTracer(LangfuseExporter(langfuse), sample_rate=0.1)
+
+        @tracer.observe(as_type="generation")
+        def call_openai(session_id, user_id, **kwargs):
+            tracer.update_current_observation(model=kwargs["model"])
+            tracer.update_current_trace(session_id=session_id, user_id=user_id)
+            ...
+
+    `async def` functions are supported as well. With `enabled=False` observe returns the function unchanged.
+    """
+
+    def __init__(
+        self,
+        exporter,
+        sample_rate=1.0,
+        batch_size=100,
+        flush_interval_s=1.0,
+        max_buffered=10_000,
+        capture_io=True,
+        enabled=True,
+    ):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_buffered = max_buffered
+        self.capture_io = capture_io
+        self.enabled = enabled
+        self.buffer = deque()
+        self.recorded = 0
+        self.dropped = 0
+        self.exported = 0
+        self.export_errors = 0
+        self._batch_ready = threading.Event()
+        self._stopped = threading.Event()
+        self._exporter_thread = threading.Thread(target=self._export_loop, name="sampled-tracer", daemon=True)
+        if enabled:
+            self._exporter_thread.start()
+
+    def _record(self, event):
+        if len(self.buffer) >= self.max_buffered:
+            self.dropped += 1
+            return
+        self.buffer.append(event)
+        self.recorded += 1
+        if len(self.buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    def _finish(self, token, observation, parent, name, as_type, start, args, kwargs, output, error):
+        _current.reset(token)
+        self._record((
+            observation.trace_id,
+            observation.id,
+            parent.id if parent else None,
+            name,
+            as_type,
+            start,
+            time.time(),
+            {"args": args, "kwargs": kwargs} if self.capture_io else None,
+            output if self.capture_io else None,
+            error,
+            observation.attributes,
+            # the root finishes last, by then nested observations have set all trace attributes
+            observation.trace if parent is None else None,
+        ))
+
+    @staticmethod
+    def update_current_trace(**kwargs):
+        """Like langfuse_context.update_current_trace, e.g. session_id, user_id, metadata, tags."""
+        current = _current.get()
+        if current is not None and current is not _NOT_SAMPLED:
+            current.trace.update(kwargs)
+
+    @staticmethod
+    def update_current_observation(**kwargs):
+        """Like langfuse_context.update_current_observation, e.g. input, model, metadata."""
+        current = _current.get()
+        if current is not None and current is not _NOT_SAMPLED:
+            if current.attributes is None:
+                current.attributes = {}
+            current.attributes.update(kwargs)
+
+    def observe(self, name=None, as_type="span"):
+        def decorator(func):
+            if not self.enabled:
+                return func
+            observation_name = name or func.__name__
+
+            def begin(parent):
+                # ids in langfuse's uuid hex format, getrandbits is much cheaper than uuid4()
+                if parent:
+                    observation = _Observation(parent.trace_id, f"{random.getrandbits(128):032x}", parent.trace)
+                else:
+                    observation = _Observation(f"{random.getrandbits(128):032x}", f"{random.getrandbits(128):032x}", {})
+                return observation, _current.set(observation)
+
+            if inspect.iscoroutinefunction(func):
+                # awaited inside the timed block, each asyncio task has its own copy of the context var
+
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    parent = _current.get()
+                    if parent is _NOT_SAMPLED:
+                        return await func(*args, **kwargs)
+                    if parent is None and random.random() >= self.sample_rate:
+                        token = _current.set(_NOT_SAMPLED)
+                        try:
+                            return await func(*args, **kwargs)
+                        finally:
+                            _current.reset(token)
+
+                    observation, token = begin(parent)
+                    start = time.time()
+                    output, error = None, None
+                    try:
+                        output = await func(*args, **kwargs)
+                        return output
+                    except Exception as e:
+                        error = repr(e)
+                        raise
+                    finally:
+                        self._finish(
+                            token, observation, parent, observation_name, as_type,
+                            start, args, kwargs, output, error,
+                        )
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                parent = _current.get()
+                if parent is _NOT_SAMPLED:
+                    return func(*args, **kwargs)
+                if parent is None and random.random() >= self.sample_rate:
+                    token = _current.set(_NOT_SAMPLED)
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        _current.reset(token)
+
+                observation, token = begin(parent)
+                start = time.time()
+                output, error = None, None
+                try:
+                    output = func(*args, **kwargs)
+                    return output
+                except Exception as e:
+                    error = repr(e)
+                    raise
+                finally:
+                    self._finish(
+                        token, observation, parent, observation_name, as_type,
+                        start, args, kwargs, output, error,
+                    )
+
+            return wrapper
+
+        return decorator
+
+    def _drain(self):
+        while self.buffer:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.buffer.popleft())
+                except IndexError:
+                    # emptied by a concurrent flush()
+                    break
+            if not batch:
+                return
+            try:
+                self.exporter(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.export_errors += 1
+                print(f"Dropping {len(batch)} trace events, export failed: {e}")
+
+    def _export_loop(self):
+        while not self._stopped.is_set():
+            self._batch_ready.wait(self.flush_interval_s)
+            self._batch_ready.clear()
+            self._drain()
+
+    def flush(self):
+        """Exports everything buffered so far from the calling thread."""
+        self._drain()
+        flush = getattr(getattr(self.exporter, "langfuse", None), "flush", None)
+        if flush is not None:
+            flush()
+
+    def shutdown(self):
+        self._stopped.set()
+        self._batch_ready.set()
+        if self._exporter_thread.is_alive():
+            self._exporter_thread.join()
+        self.flush()
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "exported": self.exported,
+            "buffered": len(self.buffer),
+            "export_errors": self.export_errors,
+        }
@@ -0,0 +1,77 @@
+import hashlib
+import os
+
+import chromadb
+from langchain_chroma import Chroma
+
+
+def chunk_id(doc):
+    """Stable id from the document source and the chunk content.
+
+    A chunk that changes gets a new id, so its old id shows up as stale.
+    """
+    source = doc.metadata.get("source", "")
+    return hashlib.sha256(f"{source}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def open_index(persist_directory, embedding, collection_name):
+    """Opens (or creates) a persistent Chroma collection for ingestion."""
+    os.makedirs(persist_directory, exist_ok=True)
+    return Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding,
+        persist_directory=persist_directory,
+    )
+
+
+def load_retriever(persist_directory, embedding, collection_name, **retriever_kwargs):
+    """Retriever over an existing collection, for query-time processes.
+
+    Never creates or re-embeds anything, raises if the index hasn't been built.
+    This is not a read-only handle: Chroma has no read-only mode, the
+    PersistentClient opens its SQLite store read-write and
+    `retriever.vectorstore` can still add or delete documents. Don't write
+    through it while an ingestion runs on the same directory.
+    """
+    if not os.path.isdir(persist_directory):
+        raise FileNotFoundError(f"No Chroma index at {persist_directory}, run the ingestion first")
+    client = chromadb.PersistentClient(path=persist_directory)
+    # get_collection raises instead of silently creating an empty collection
+    client.get_collection(collection_name)
+    vectorstore = Chroma(client=client, collection_name=collection_name, embedding_function=embedding)
+    return vectorstore.as_retriever(**retriever_kwargs)
+
+
+def sync_documents(vectorstore, documents, sources=None, batch_size=1000):
+    """Upserts `documents` into the collection and deletes stale chunks.
+
+    Only chunks whose id isn't stored yet are embedded. Stored chunks of the
+    reconciled `sources` (by default every source in `documents`) that are not
+    in `documents` anymore are deleted.
+    """
+    docs_by_id = {}
+    for doc in documents:
+        docs_by_id.setdefault(chunk_id(doc), doc)
+    if sources is None:
+        sources = {doc.metadata.get("source", "") for doc in documents}
+
+    existing = set()
+    for source in sources:
+        existing.update(vectorstore.get(where={"source": source}, include=[])["ids"])
+
+    new_ids = [id_ for id_ in docs_by_id if id_ not in existing]
+    stale_ids = sorted(existing - set(docs_by_id))
+
+    for i in range(0, len(new_ids), batch_size):
+        batch = new_ids[i:i + batch_size]
+        vectorstore.add_documents([docs_by_id[id_] for id_ in batch], ids=batch)
+    for i in range(0, len(stale_ids), batch_size):
+        vectorstore.delete(ids=stale_ids[i:i + batch_size])
+
+    stats = {
+        "added": len(new_ids),
+        "deleted": len(stale_ids),
+        "unchanged": len(docs_by_id) - len(new_ids),
+    }
+    print(f"Index sync: {stats}")
+    return stats
@@ -0,0 +1,137 @@
+# Local stand-in for the LoRAX server with the same batching knobs, for sweep_batching.py
+# python mock_lorax.py --port 8000 --max_batch_total_tokens 4096 --max_concurrent_requests 256
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Request:
+    def __init__(self, prompt_tokens, max_new_tokens, steps):
+        self.prompt_tokens = prompt_tokens
+        self.max_new_tokens = max_new_tokens
+        # decode steps until the mock "stops", real generations usually end before max_new_tokens
+        self.steps = steps
+        self.generated = 0
+        self.done = threading.Event()
+
+    @property
+    def reserved_tokens(self):
+        # like TGI/LoRAX the whole prompt + max_new_tokens is reserved on admission
+        return self.prompt_tokens + self.max_new_tokens
+
+
+class ContinuousBatcher:
+    """Continuous batching: every decode step admits waiting requests while the
+    reserved tokens fit in max_batch_total_tokens, then advances every running
+    request by one token.
+
+    Step cost model (A10G-ish for a 7B model):
+    prefill_ms_per_token * admitted prompt tokens + decode_ms + decode_ms_per_seq * batch size
+    """
+
+    def __init__(self, args):
+        self.max_batch_total_tokens = args.max_batch_total_tokens
+        self.max_concurrent_requests = args.max_concurrent_requests
+        self.prefill_ms_per_token = args.prefill_ms_per_token
+        self.decode_ms = args.decode_ms
+        self.decode_ms_per_seq = args.decode_ms_per_seq
+        self.waiting = deque()
+        self.running = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, request):
+        with self.lock:
+            if len(self.waiting) + len(self.running) >= self.max_concurrent_requests:
+                return False
+            self.waiting.append(request)
+        self.wakeup.set()
+        return True
+
+    def _loop(self):
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                reserved = sum(r.reserved_tokens for r in self.running)
+                prefill_tokens = 0
+                while self.waiting and reserved + self.waiting[0].reserved_tokens <= self.max_batch_total_tokens:
+                    request = self.waiting.popleft()
+                    reserved += request.reserved_tokens
+                    prefill_tokens += request.prompt_tokens
+                    self.running.append(request)
+                batch = list(self.running)
+                if not batch and not self.waiting:
+                    self.wakeup.clear()
+                    continue
+
+            time.sleep(
+                (prefill_tokens * self.prefill_ms_per_token + self.decode_ms + self.decode_ms_per_seq * len(batch))
+                / 1000
+            )
+            with self.lock:
+                for request in batch:
+                    request.generated += 1
+                    if request.generated >= request.steps:
+                        self.running.remove(request)
+                        request.done.set()
+
+
+def make_handler(batcher, generated_tokens):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/generate":
+                self._reply(404, {"error": "not found"})
+                return
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            max_new_tokens = body.get("parameters", {}).get("max_new_tokens", 20)
+            # rough chars per token for English prompts
+            request = Request(max(1, len(body["inputs"]) // 4), max_new_tokens, min(max_new_tokens, generated_tokens))
+            if request.reserved_tokens > batcher.max_batch_total_tokens:
+                # could never be admitted, the real server rejects it up front
+                self._reply(422, {"error": "Input validation error: too many tokens", "error_type": "validation"})
+                return
+            if not batcher.submit(request):
+                self._reply(429, {"error": "Model is overloaded", "error_type": "overloaded"})
+                return
+            request.done.wait()
+            self._reply(200, {"generated_text": " ".join(["token"] * request.generated)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max_batch_total_tokens", type=int, default=4096)
+    parser.add_argument("--max_concurrent_requests", type=int, default=256)
+    parser.add_argument("--generated_tokens", type=int, default=32, help="Decode steps per request, capped by max_new_tokens")
+    parser.add_argument("--prefill_ms_per_token", type=float, default=0.1)
+    parser.add_argument("--decode_ms", type=float, default=25.0)
+    parser.add_argument("--decode_ms_per_seq", type=float, default=0.4)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(ContinuousBatcher(args), args.generated_tokens))
+    server.daemon_threads = True
+    print(f"Mock LoRAX listening on :{args.port}")
+    server.serve_forever()
@@ -0,0 +1,172 @@
+# Sweeps LoRAX batching settings with the Locust workload and reports the Pareto-optimal ones
+# python sweep_batching.py --backend mock --max_batch_total_tokens 2048 4096 8192 --max_concurrent_requests 64 128 256
+# python sweep_batching.py --backend docker --max_batch_total_tokens 4096 8192 --max_concurrent_requests 128 256
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_healthy(host, timeout_s):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{host}/health", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(2)
+    raise TimeoutError(f"Server at {host} not healthy after {timeout_s}s")
+
+
+class MockBackend:
+    def __init__(self, args):
+        self.port = args.port
+        self.process = None
+
+    def start(self, setting):
+        self.process = subprocess.Popen([
+            sys.executable, os.path.join(HERE, "mock_lorax.py"),
+            "--port", str(self.port),
+            "--max_batch_total_tokens", str(setting["MAX_BATCH_TOTAL_TOKENS"]),
+            "--max_concurrent_requests", str(setting["MAX_CONCURRENT_REQUESTS"]),
+        ])
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class DockerBackend:
+    """Recreates the lorax service from docker-compose.yaml with the setting as environment."""
+
+    def __init__(self, args):
+        self.compose_file = os.path.join(HERE, "docker-compose.yaml")
+
+    def _compose(self, *cmd, env=None):
+        subprocess.run(["docker", "compose", "-f", self.compose_file, *cmd], check=True, env=env)
+
+    def start(self, setting):
+        env = {**os.environ, **{key: str(value) for key, value in setting.items()}}
+        self._compose("up", "-d", "--force-recreate", "lorax", env=env)
+
+    def stop(self):
+        self._compose("stop", "lorax")
+
+
+def to_float(value):
+    # locust writes N/A for percentiles of empty stats
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
+
+
+def run_locust(host, args, csv_prefix):
+    # measure serving performance only, mock answers are fake and real ones vary with the setting
+    env = {**os.environ, "CHECK_OUTPUT": "0"}
+    subprocess.run([
+        "locust", "-f", os.path.join(HERE, "locustfile.py"),
+        "--headless",
+        "--host", host,
+        "--users", str(args.users),
+        "--spawn-rate", str(args.spawn_rate),
+        "--run-time", args.run_time,
+        "--csv", csv_prefix,
+        "--only-summary",
+    ], check=False, env=env)
+
+    with open(f"{csv_prefix}_stats.csv", newline="") as f:
+        aggregated = next(row for row in csv.DictReader(f) if row["Name"] == "Aggregated")
+    requests = int(aggregated["Request Count"])
+    failures = int(aggregated["Failure Count"])
+    return {
+        "requests": requests,
+        "failures": failures,
+        "failure_rate": failures / requests if requests else 1.0,
+        # rejected (429) requests are fast, only successful ones count as throughput
+        "requests_per_sec": to_float(aggregated["Requests/s"]) - to_float(aggregated["Failures/s"]),
+        "p50_ms": to_float(aggregated["50%"]),
+        "p90_ms": to_float(aggregated["90%"]),
+        "p99_ms": to_float(aggregated["99%"]),
+    }
+
+
+def pareto_front(results, latency_key, max_failure_rate):
+    """Settings no other setting beats on both throughput (higher) and latency (lower).
+
+    Locust's percentiles include failed requests, and 429/422 rejections are
+    fast, so settings rejecting more than `max_failure_rate` of the requests
+    (or without latency stats) are left out instead of looking quick.
+    """
+    candidates = [
+        result for result in results
+        if result["failure_rate"] <= max_failure_rate and not math.isnan(result[latency_key])
+    ]
+    front = []
+    for result in candidates:
+        dominated = any(
+            other["requests_per_sec"] >= result["requests_per_sec"]
+            and other[latency_key] <= result[latency_key]
+            and (other["requests_per_sec"] > result["requests_per_sec"] or other[latency_key] < result[latency_key])
+            for other in candidates
+        )
+        if not dominated:
+            front.append(result)
+    return sorted(front, key=lambda result: result["requests_per_sec"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["mock", "docker"], default="mock")
+    parser.add_argument("--max_batch_total_tokens", type=int, nargs="+", default=[2048, 4096, 8192, 16384])
+    parser.add_argument("--max_concurrent_requests", type=int, nargs="+", default=[32, 64, 128, 256])
+    parser.add_argument("--host", default=None, help="Defaults to http://localhost:<port>")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--spawn_rate", type=int, default=10)
+    parser.add_argument("--run_time", default="2m")
+    parser.add_argument("--startup_timeout_s", type=int, default=900, help="Model download + load for docker")
+    parser.add_argument("--latency", choices=["p50_ms", "p90_ms", "p99_ms"], default="p90_ms")
+    parser.add_argument("--max_failure_rate", type=float, default=0.01, help="Settings above it can't be Pareto-optimal")
+    parser.add_argument("--output_dir", default=os.path.join(HERE, "sweep_results"))
+    args = parser.parse_args()
+
+    host = args.host or f"http://localhost:{args.port}"
+    backend = MockBackend(args) if args.backend == "mock" else DockerBackend(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    results = []
+    for batch_tokens, concurrent in itertools.product(args.max_batch_total_tokens, args.max_concurrent_requests):
+        setting = {"MAX_BATCH_TOTAL_TOKENS": batch_tokens, "MAX_CONCURRENT_REQUESTS": concurrent}
+        print(f"Running {setting}")
+        backend.start(setting)
+        try:
+            wait_healthy(host, args.startup_timeout_s)
+            stats = run_locust(host, args, os.path.join(args.output_dir, f"tokens_{batch_tokens}_concurrent_{concurrent}"))
+        finally:
+            backend.stop()
+        results.append({**setting, **stats})
+        print(results[-1])
+
+    front = pareto_front(results, args.latency, args.max_failure_rate)
+    with open(os.path.join(args.output_dir, "sweep.json"), "w") as f:
+        json.dump({"backend": args.backend, "users": args.users, "results": results, "pareto": front}, f, indent=2)
+
+    print(f"\nPareto-optimal settings (requests/s vs {args.latency}, failure rate <= {args.max_failure_rate:.1%}):")
+    print(f"{'MAX_BATCH_TOTAL_TOKENS':>24}{'MAX_CONCURRENT_REQUESTS':>25}{'req/s':>10}{args.latency:>10}{'failures':>10}")
+    for result in front:
+        print(
+            f"{result['MAX_BATCH_TOTAL_TOKENS']:>24}{result['MAX_CONCURRENT_REQUESTS']:>25}"
+            f"{result['requests_per_sec']:>10.2f}{result[args.latency]:>10.0f}{result['failures']:>10}"
+        )
@@ -1,39 +1,63 @@
 #!/bin/bash
 import boto3
 import csv
+import os
+import threading
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import uuid
 
-iam = boto3.client('iam')
-
 total_users = 60
 group_name = 'llmops-workshop-attendee-group'
+csv_file = 'user_credentials.csv'
+fieldnames = ['Link', 'UserName', 'Password']
+max_workers = 8
+
+# adaptive mode backs off and rate limits the client on Throttling errors
+retry_config = Config(retries={'mode': 'adaptive', 'max_attempts': 10})
+
+
 # Create the group if it doesn't exist
-try:
-    iam.get_group(GroupName=group_name)
-    print(f"Group '{group_name}' already exists.")
-except ClientError as e:
-    if e.response['Error']['Code'] == 'NoSuchEntity':
-        iam.create_group(GroupName=group_name)
-        print(f"Group '{group_name}' created.")
-    else:
-        raise
-
-# Function to create a user and add to the group
-def create_user(user_name):
+def ensure_group(iam, group_name):
+    try:
+        iam.get_group(GroupName=group_name)
+        print(f"Group '{group_name}' already exists.")
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchEntity':
+            iam.create_group(GroupName=group_name)
+            print(f"Group '{group_name}' created.")
+        else:
+            raise
+
+
+# Function to create a user and add to the group, safe to re-run for a half created user
+def create_user(iam, user_name, group_name):
     try:
         # Create the user
-        iam.create_user(UserName=user_name)
-        print(f"User '{user_name}' created.")
+        try:
+            iam.create_user(UserName=user_name)
+            print(f"User '{user_name}' created.")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'EntityAlreadyExists':
+                raise
+            print(f"User '{user_name}' already exists.")
 
         # Add the user to the group
         iam.add_user_to_group(GroupName=group_name, UserName=user_name)
         print(f"User '{user_name}' added to group '{group_name}'.")
 
         # Create login profile for console access
-        password = f"Pwd{str(uuid.uuid4())[:10]}123!" 
-        iam.create_login_profile(UserName=user_name, Password=password, PasswordResetRequired=False)
-        print(f"Login profile created for user '{user_name}'.")
+        password = f"Pwd{str(uuid.uuid4())[:10]}123!"
+        try:
+            iam.create_login_profile(UserName=user_name, Password=password, PasswordResetRequired=False)
+            print(f"Login profile created for user '{user_name}'.")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'EntityAlreadyExists':
+                raise
+            # the previous password never made it to the CSV, so reset it
+            iam.update_login_profile(UserName=user_name, Password=password, PasswordResetRequired=False)
+            print(f"Login profile reset for user '{user_name}'.")
 
         # Create access keys
         # access_key = iam.create_access_key(UserName=user_name)['AccessKey']
@@ -50,24 +74,61 @@ def create_user(user_name):
         print(f"Error creating user '{user_name}': {e}")
         return None
 
-# List to store user credentials
-user_credentials = []
 
-# Create users and store their credentials
-for i in range(1, total_users):
-    user_name = f'user-{i}-llmops-workshop'
-    credentials = create_user(user_name)
-    if credentials:
-        user_credentials.append(credentials)
+def completed_users(csv_file):
+    if not os.path.exists(csv_file):
+        return set()
+    with open(csv_file, newline='') as csvfile:
+        return {row['UserName'] for row in csv.DictReader(csvfile)}
 
-# Write credentials to a CSV file
-csv_file = 'user_credentials.csv'
-with open(csv_file, 'w', newline='') as csvfile:
-    fieldnames = ['Link', 'UserName', 'Password']
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
-    writer.writeheader()
-    for user_cred in user_credentials:
-        writer.writerow(user_cred)
+class CredentialWriter:
+    """Appends one row per provisioned user so progress survives a crash."""
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.lock = threading.Lock()
+
+    def write(self, user_cred):
+        with self.lock:
+            new_file = not os.path.exists(self.csv_file) or os.path.getsize(self.csv_file) == 0
+            with open(self.csv_file, 'a', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(user_cred)
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
+
+
+def provision_users(iam, user_names, group_name, csv_file, max_workers=max_workers):
+    """Creates every user not already in csv_file, returns the names that failed."""
+    ensure_group(iam, group_name)
+
+    done = completed_users(csv_file)
+    pending = [user_name for user_name in user_names if user_name not in done]
+    print(f"{len(done)} users already provisioned, {len(pending)} to go.")
+
+    writer = CredentialWriter(csv_file)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(create_user, iam, user_name, group_name): user_name for user_name in pending}
+        for future in as_completed(futures):
+            credentials = future.result()
+            if credentials:
+                writer.write(credentials)
+            else:
+                failed.append(futures[future])
+    return sorted(failed)
+
+
+if __name__ == "__main__":
+    iam = boto3.client('iam', config=retry_config)
+
+    # Create users and store their credentials
+    user_names = [f'user-{i}-llmops-workshop' for i in range(1, total_users)]
+    failed = provision_users(iam, user_names, group_name, csv_file)
 
-print(f"User credentials have been written to '{csv_file}'.")
\ No newline at end of file
+    print(f"User credentials have been written to '{csv_file}'.")
+    if failed:
+        print(f"Failed to create {len(failed)} users, re-run to retry: {failed}")
@@ -1,18 +1,41 @@
 import boto3
 import dotenv
 import os
+import time
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 print(dotenv.load_dotenv('./.env'))
 
-def create_user_profile(domain_id, user_profile_name, execution_role_arn, aws_access_key_id, aws_secret_access_key, region_name):
-    sagemaker_client = boto3.client(
+max_workers = 8
+poll_interval_seconds = 10
+poll_timeout_seconds = 900
+
+
+def create_sagemaker_client(aws_access_key_id, aws_secret_access_key, region_name):
+    # one client shared by all threads, with a connection per worker
+    return boto3.client(
         'sagemaker',
         aws_access_key_id=aws_access_key_id,
         aws_secret_access_key=aws_secret_access_key,
-        region_name=region_name
+        region_name=region_name,
+        config=Config(max_pool_connections=max_workers, retries={'mode': 'adaptive', 'max_attempts': 10}),
     )
 
-    response = sagemaker_client.create_user_profile(
+
+def list_user_profiles(sagemaker_client, domain_id):
+    """Returns {user profile name: status} for the domain, one ListUserProfiles page walk."""
+    profiles = {}
+    paginator = sagemaker_client.get_paginator('list_user_profiles')
+    for page in paginator.paginate(DomainIdEquals=domain_id):
+        for profile in page['UserProfiles']:
+            profiles[profile['UserProfileName']] = profile['Status']
+    return profiles
+
+
+def create_user_profile(sagemaker_client, domain_id, user_profile_name, execution_role_arn):
+    sagemaker_client.create_user_profile(
         DomainId=domain_id,
         UserProfileName=user_profile_name,
         UserSettings={
@@ -21,20 +44,115 @@ def create_user_profile(domain_id, user_profile_name, execution_role_arn, aws_ac
     )
     print(f"Created user profile: {user_profile_name}")
 
-# Example usage
-# domain_id = 'd-fhbmxy36y0dt'
-# execution_role_arn = 'arn:aws:iam::009676737623:role/service-role/AmazonSageMaker-ExecutionRole-20240809T183503'
 
-# domain_id = 'd-uxgguf8z6vcn'
-# execution_role_arn = 'arn:aws:iam::009676737623:role/service-role/AmazonSageMaker-ExecutionRole-20240809T183675'
+def wait_for_profiles(sagemaker_client, domain_id, user_profile_names):
+    """Polls the whole domain at once until every profile left the Pending state.
+
+    A profile not listed yet counts as pending, ListUserProfiles can lag behind a create.
+    """
+    pending = set(user_profile_names)
+    statuses = {}
+    deadline = time.monotonic() + poll_timeout_seconds
+    while pending and time.monotonic() < deadline:
+        time.sleep(poll_interval_seconds)
+        statuses = list_user_profiles(sagemaker_client, domain_id)
+        pending = {name for name in pending if statuses.get(name, 'Pending') == 'Pending'}
+        print(f"{domain_id}: {len(pending)} user profiles still pending")
+    return {name: statuses.get(name, 'Pending') for name in user_profile_names}
+
+
+def delete_failed_profiles(sagemaker_client, domain_id, user_profile_names):
+    """Deletes profiles left in the Failed state and waits until they are gone, so they can be created again."""
+    for name in user_profile_names:
+        sagemaker_client.delete_user_profile(DomainId=domain_id, UserProfileName=name)
+        print(f"Deleting failed user profile: {name}")
+    pending = set(user_profile_names)
+    deadline = time.monotonic() + poll_timeout_seconds
+    while pending and time.monotonic() < deadline:
+        time.sleep(poll_interval_seconds)
+        pending &= set(list_user_profiles(sagemaker_client, domain_id))
+        print(f"{domain_id}: {len(pending)} failed user profiles still deleting")
+    return sorted(set(user_profile_names) - pending)
+
+
+def reconcile_user_profiles(sagemaker_client, domain_id, execution_role_arn, desired_profiles):
+    """Creates the desired profiles that don't exist yet in the domain and waits for them.
+
+    API calls scale with the number of missing profiles, not with the roster.
+    Profiles in the Failed state are deleted and created again. Returns the
+    status of every desired profile. A failed create doesn't stop the others,
+    it is reported as 'CreateFailed'. Delete_Failed / Update_Failed profiles
+    need manual action and are reported with that status.
+    """
+    existing = list_user_profiles(sagemaker_client, domain_id)
+    statuses = {name: existing[name] for name in desired_profiles if name in existing}
+    failed_existing = sorted(name for name, status in statuses.items() if status == 'Failed')
+    if failed_existing:
+        for name in delete_failed_profiles(sagemaker_client, domain_id, failed_existing):
+            del statuses[name]
+    missing = sorted(set(desired_profiles) - set(statuses))
+    print(f"{domain_id}: {len(desired_profiles) - len(missing)} user profiles exist, creating {len(missing)}")
+    if not missing:
+        report_statuses(domain_id, statuses, {})
+        return statuses
+
+    created = []
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(create_user_profile, sagemaker_client, domain_id, name, execution_role_arn): name
+            for name in missing
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+                created.append(name)
+            except ClientError as e:
+                errors[name] = e.response['Error']['Code']
+                print(f"Error creating user profile {name}: {e}")
+
+    if created:
+        statuses.update(wait_for_profiles(sagemaker_client, domain_id, sorted(created)))
+    statuses.update({name: 'CreateFailed' for name in errors})
+    report_statuses(domain_id, statuses, errors)
+    return statuses
+
+
+def report_statuses(domain_id, statuses, errors):
+    failed = {name: status for name, status in statuses.items() if status != 'InService'}
+    if failed:
+        print(f"{domain_id}: user profiles not in service: {failed}")
+    manual = sorted(name for name, status in failed.items() if status in ('Delete_Failed', 'Update_Failed'))
+    if manual:
+        print(f"{domain_id}: fix or delete these user profiles in the console: {manual}")
+    if errors:
+        print(f"{domain_id}: create errors: {errors}")
+
 
-domain_id = "d-sev3miuv8s3c"
-execution_role_arn = "arn:aws:iam::009676737623:role/service-role/AmazonSageMaker-ExecutionRole-20240809T183693"
+# Desired user profiles per domain, re-running only creates what is missing
+domains = {
+    # 'd-fhbmxy36y0dt': {
+    #     'execution_role_arn': 'arn:aws:iam::009676737623:role/service-role/AmazonSageMaker-ExecutionRole-20240809T183503',
+    #     'user_profiles': [f'user-{i}' for i in range(1, 21)],
+    # },
+    # 'd-uxgguf8z6vcn': {
+    #     'execution_role_arn': 'arn:aws:iam::009676737623:role/service-role/AmazonSageMaker-ExecutionRole-20240809T183675',
+    #     'user_profiles': [f'user-{i}' for i in range(21, 41)],
+    # },
+    'd-sev3miuv8s3c': {
+        'execution_role_arn': 'arn:aws:iam::009676737623:role/service-role/AmazonSageMaker-ExecutionRole-20240809T183693',
+        'user_profiles': [f'user-{i}' for i in range(41, 61)],
+    },
+}
 
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-region_name = 'ap-south-1'
+if __name__ == "__main__":
+    aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+    aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+    region_name = 'ap-south-1'
 
-for i in range(41, 61):
-    user_profile_name = f'user-{i}'
-    create_user_profile(domain_id, user_profile_name, execution_role_arn, aws_access_key_id, aws_secret_access_key, region_name)
\ No newline at end of file
+    sagemaker_client = create_sagemaker_client(aws_access_key_id, aws_secret_access_key, region_name)
+    for domain_id, domain in domains.items():
+        reconcile_user_profiles(
+            sagemaker_client, domain_id, domain['execution_role_arn'], domain['user_profiles']
+        )
@@ -1,3 +1,4 @@
+import argparse
 import json
 import pathlib
 import pickle
@@ -12,13 +13,19 @@ from sklearn.metrics import mean_squared_error
 
 
 if __name__ == "__main__":
-    model_path = f"/opt/ml/processing/model/model.tar.gz"
+    parser = argparse.ArgumentParser()
+    # overridable to run outside of a processing job, e.g. from the benchmarks
+    parser.add_argument("--base_dir", default="/opt/ml/processing")
+    args, _ = parser.parse_known_args()
+    base_dir = args.base_dir
+
+    model_path = f"{base_dir}/model/model.tar.gz"
     with tarfile.open(model_path) as tar:
         tar.extractall(path=".")
 
     model = pickle.load(open("xgboost-model", "rb"))
 
-    test_path = "/opt/ml/processing/test/test.csv"
+    test_path = f"{base_dir}/test/test.csv"
     df = pd.read_csv(test_path, header=None)
 
     y_test = df.iloc[:, 0].to_numpy()
@@ -36,7 +43,7 @@ if __name__ == "__main__":
         },
     }
 
-    output_dir = "/opt/ml/processing/evaluation"
+    output_dir = f"{base_dir}/evaluation"
     pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
 
     evaluation_path = f"{output_dir}/evaluation.json"
@@ -157,6 +157,7 @@ processor_args = sklearn_processor.run(
         ProcessingOutput(output_name="train", source="/opt/ml/processing/train"),
         ProcessingOutput(output_name="validation", source="/opt/ml/processing/validation"),
         ProcessingOutput(output_name="test", source="/opt/ml/processing/test"),
+        ProcessingOutput(output_name="transformer", source="/opt/ml/processing/transformer"),
     ],
     code="code/preprocessing.py",
 )